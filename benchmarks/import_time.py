@@ -0,0 +1,79 @@
+
+"""
+Usage:
+    import_time.py [-n <repeat>] [--ref <git_rev>]
+
+Options:
+    -n <repeat>         各importを新しいinterpreterで実行する回数(最小値を表示) [default: 5]
+    --ref <git_rev>     比較するgitのrevision. そのrevisionのwtplotを一時directoryに取り出して同じ計測をする
+
+wtplotの各importにかかる時間と, そのときに読み込まれる重いmoduleを表示する。
+時間はinterpreterの起動時間を除いたもの。
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+from docopt import docopt
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+cases = [
+    ("import wtplot",                         "import wtplot"),
+    ("from wtplot import calc_anc",           "from wtplot import calc_anc"),
+    ("import wtplot.anccalc",                 "import wtplot.anccalc"),
+    ("import wtplot.datio",                   "import wtplot.datio"),
+    ("import wtplot.bandgapplot",             "import wtplot.bandgapplot"),
+]
+heavy = [ "matplotlib", "pandas", "scipy.special", "scipy.signal", "plottool", "BZplot", "mpl_toolkits.mplot3d" ]
+
+probe = """
+import sys, time, json
+t0 = time.perf_counter()
+{}
+t1 = time.perf_counter()
+print(json.dumps({{"time": t1 - t0, "loaded": [ m for m in {} if m in sys.modules ]}}))
+"""
+
+def measure(stmt, path, repeat):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([ path ] + [ p for p in env.get("PYTHONPATH", "").split(os.pathsep) if p ])
+    res = []
+    for i in range(repeat):
+        out = subprocess.run([ sys.executable, "-c", probe.format(stmt, heavy) ], env=env, cwd=path, \
+                             capture_output=True, text=True, check=True).stdout
+        res.append(json.loads(out.strip().splitlines()[-1]))
+    return min(r["time"] for r in res), res[0]["loaded"]
+
+def checkout(rev, dest):
+    #revのwtplot/をdestに取り出す
+    os.makedirs(dest, exist_ok=True)
+    tar = subprocess.run([ "git", "-C", root, "archive", rev, "wtplot" ], capture_output=True, check=True).stdout
+    subprocess.run([ "tar", "-x", "-C", dest ], input=tar, check=True)
+
+def main(argv=None):
+    args = docopt(__doc__, argv=argv)
+    repeat = int(args['-n'])
+    paths = [ ("current", root) ]
+    tmp = None
+    if args['--ref'] is not None:
+        tmp = tempfile.mkdtemp()
+        checkout(args['--ref'], tmp)
+        paths.append((args['--ref'], tmp))
+
+    try:
+        for name, path in paths:
+            print("== {} ==".format(name))
+            for label, stmt in cases:
+                try:
+                    t, loaded = measure(stmt, path, repeat)
+                    print("{:<32} {:8.1f} ms  {}".format(label, t * 1e3, " ".join(loaded)))
+                except subprocess.CalledProcessError:
+                    print("{:<32} {:>8}".format(label, "failed"))
+    finally:
+        if tmp is not None: shutil.rmtree(tmp)
+
+if __name__ == '__main__': main()
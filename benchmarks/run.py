@@ -0,0 +1,173 @@
+
+"""
+Usage:
+    run.py [-s <size>] [-k <pattern>] [-n <repeat>] [-d <data_dir>] [-b <baseline>] [--save <baseline>] [--threshold <ratio>] [--dtype <dtype>]
+
+Options:
+    -s <size>               datfileの大きさ, small, medium, large [default: small]
+    -k <pattern>            名前にpatternを含むbenchmarkだけを実行する
+    -n <repeat>             各benchmarkを実行する回数, 時間は最小値を使う [default: 5]
+    -d <data_dir>           作ったdatfileを置くdirectory, 指定すると次回からは作らずに使う
+    -b <baseline>           比較するbaselineのjson. 時間か最大memoryがthreshold以上増えたら終了statusを1にする
+    --save <baseline>       結果をbaselineのjsonとして保存する
+    --threshold <ratio>     regressionとみなす増加の割合 [default: 0.25]
+    --dtype <dtype>         readerに渡すdtype, f4にするとcompact modeの計測になる [default: f8]
+
+wtplotの重い処理の時間とtracemallocで測った最大memoryを表示する。
+datfileはbenchmarks/synth.pyで作る合成dataで, networkは使わない。
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import tracemalloc
+from docopt import docopt
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import synth
+import wtplot.datio as datio
+
+#text fileの変換結果のcacheを使うと2回目以降は読み込みの計測にならないので使わない
+datio.cache_dir = ""
+
+sizes = {
+    #ahc, ancの行数, curv, bandplaneのmeshの1辺, gapの点数
+    'small' : { 'ene': 2001,   'mesh': 101, 'nband': 8,  'gap': 20000 },
+    'medium': { 'ene': 20001,  'mesh': 301, 'nband': 16, 'gap': 500000 },
+    'large' : { 'ene': 200001, 'mesh': 501, 'nband': 24, 'gap': 2000000 },
+}
+
+def make_data(data_dir, size):
+    #size用のdatfileを作り, そのpathのdictを返す。すでにあるfileは作り直さない
+    p = sizes[size]
+    files = {
+        'ahc'  : (synth.write_ahc, p['ene']),
+        'anc'  : (synth.write_anc, p['ene']),
+        'curv' : (synth.write_curv, p['mesh']),
+        'bp'   : (lambda path, n: synth.write_bandplane(path, n, p['nband']), p['mesh']),
+        'gap'  : (synth.write_gap, p['gap']),
+    }
+    paths = {}
+    for name, (write, n) in files.items():
+        paths[name] = os.path.join(data_dir, "{}_{}.dat".format(name, n))
+        if not os.path.exists(paths[name]): write(paths[name], n)
+    return paths
+
+def agg_figure(projection='3d'):
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+    from matplotlib import pyplot as plt
+    fig = plt.figure()
+    return fig, fig.add_subplot(projection=projection)
+
+def draw_and_close(fig):
+    from matplotlib import pyplot as plt
+    fig.canvas.draw()
+    plt.close(fig)
+
+def benchmarks(paths, dtype='f8'):
+    #(名前, 実行する関数)のlist。前準備はここで済ませ, 関数は計測する処理だけを行う
+    from wtplot.ahcplot import read_ahc_dat
+    from wtplot.ancplot import read_anc_dat
+    from wtplot.curvplot import read_curv_dat, curv_3dvec_plot
+    from wtplot.bd_plane_plot import read_bulkek_plane_dat
+    from wtplot.bandgapplot import read_gapdat, convertinBZ, copyKpoints, Klimit, plot_gapdat
+    from wtplot.anccalc import calc_anc
+
+    Ene, AHC = read_ahc_dat(paths['ahc'], 1, False)
+    Ene, AHC = np.array(Ene), np.array(AHC)
+    kp, curv = read_curv_dat(paths['curv'], [6, 9], dtype=dtype)
+    K, Eg = read_gapdat(paths['gap'], [-100, 100], 1.0, dtype=dtype)
+    kcell = synth.kcell
+    lim = [ -0.6, 0.6 ]
+    #描画は点の数が大きすぎると終わらないので上限を設ける
+    Kp, Ep = K[:, :200000], Eg[:200000]
+
+    def curv_fig():
+        fig, ax = agg_figure()
+        curv_3dvec_plot(ax, fig, kp, curv, stride=2)
+        draw_and_close(fig)
+
+    def gap_fig():
+        fig, ax = agg_figure()
+        plot_gapdat(ax, fig, Kp, Ep, 2)
+        draw_and_close(fig)
+
+    return [
+        ("calc_anc.vector",        lambda: calc_anc(Ene, AHC, 100, method='vector')),
+        ("calc_anc.analytic",      lambda: calc_anc(Ene, AHC, 100, method='analytic')),
+        ("calc_anc.conv",          lambda: calc_anc(Ene, AHC, 100, method='conv')),
+        ("read_ahc_dat",           lambda: read_ahc_dat(paths['ahc'], 1, False, dtype=dtype)),
+        ("read_anc_dat",           lambda: read_anc_dat(paths['anc'], False, dtype=dtype)),
+        ("read_curv_dat",          lambda: read_curv_dat(paths['curv'], [6, 9], dtype=dtype)),
+        ("read_bulkek_plane_dat",  lambda: read_bulkek_plane_dat(paths['bp'], dtype=dtype)),
+        ("read_gapdat",            lambda: read_gapdat(paths['gap'], [-100, 100], 0.02, dtype=dtype)),
+        ("convertinBZ",            lambda: convertinBZ(K, kcell)),
+        ("copyKpoints",            lambda: copyKpoints(K, kcell, 1, E=Eg)),
+        ("Klimit",                 lambda: Klimit(K, Eg, kcell, lim, lim, lim, shift_num=1)),
+        ("curv_3dvec_plot",        curv_fig),
+        ("plot_gapdat",            gap_fig),
+    ]
+
+def measure(func, repeat):
+    #時間はrepeat回の最小値, memoryは別に1回実行してtracemallocで測った最大値
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return { "time": min(times), "peak": peak }
+
+def compare(result, baseline, threshold):
+    #baselineよりthreshold以上増えた項目の説明のlist
+    bad = []
+    for name, r in result.items():
+        if name not in baseline: continue
+        for key in ("time", "peak"):
+            if r[key] > baseline[name][key] * (1 + threshold):
+                bad.append("{} {}: {:.4g} -> {:.4g} (x{:.2f})".format(name, key, \
+                           baseline[name][key], r[key], r[key] / baseline[name][key]))
+    return bad
+
+def main(argv=None):
+    args = docopt(__doc__, argv=argv)
+    size = args['-s']
+    repeat = int(args['-n'])
+    if size not in sizes: raise SystemExit("unknown size: {}".format(size))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args['-d'] if args['-d'] is not None else tmp
+        os.makedirs(data_dir, exist_ok=True)
+        paths = make_data(data_dir, size)
+
+        result = {}
+        print("{:<26} {:>12} {:>12}".format("benchmark ({})".format(size), "time [ms]", "peak [MiB]"))
+        for name, func in benchmarks(paths, args['--dtype']):
+            if args['-k'] is not None and args['-k'] not in name: continue
+            r = measure(func, repeat)
+            result[name] = r
+            print("{:<26} {:12.2f} {:12.2f}".format(name, r["time"] * 1e3, r["peak"] / 2**20))
+
+    if args['--save'] is not None:
+        with open(args['--save'], 'w') as f:
+            json.dump({ "size": size, "dtype": args['--dtype'], "results": result }, f, indent=1)
+
+    if args['-b'] is not None:
+        with open(args['-b'], 'r') as f: base = json.load(f)
+        if base.get("size") != size:
+            raise SystemExit("baseline was measured with size '{}'".format(base.get("size")))
+        if base.get("dtype", "f8") != args['--dtype']:
+            raise SystemExit("baseline was measured with dtype '{}'".format(base.get("dtype", "f8")))
+        bad = compare(result, base["results"], float(args['--threshold']))
+        for b in bad: print("regression: " + b)
+        if len(bad) > 0: raise SystemExit(1)
+        print("no regression (threshold {:.0%})".format(float(args['--threshold'])))
+
+if __name__ == '__main__': main()
@@ -0,0 +1,77 @@
+
+"""
+benchmark用の, WannierToolsの出力と同じ形式のdatfileを作る
+
+すべての関数は乱数のseedを固定しているので, 同じ引数なら同じfileになる。
+"""
+
+import numpy as np
+
+#単純立方格子より少し歪ませた逆格子ベクトル(行ごと)
+kcell = np.array([ [ 1.00, 0.00, 0.00 ],
+                   [ 0.30, 0.95, 0.00 ],
+                   [ 0.10, 0.20, 0.90 ] ])
+
+def write_ahc(path, n):
+    #ahcのdat: 3行のheaderとEne, sxy, syz, szxの4列
+    Ene = np.linspace(-0.5, 0.5, n)
+    sigma = np.column_stack([ 50*np.sin(8*Ene), -50*Ene, 30*np.tanh(10*Ene) ])
+    with open(path, 'w') as f:
+        f.write("# header\n# E sxy syz szx\n# units\n")
+        np.savetxt(f, np.column_stack([ Ene, sigma ]), fmt='%12.6f')
+
+def write_anc(path, n, T=(10, 100, 300)):
+    #anccalcの出力と同じ形式のancdat
+    Ene = np.linspace(-0.5, 0.5, n)
+    cols = [ Ene, -50*Ene ] + [ -1e-3*tp*np.exp(-Ene**2/0.01) for tp in T ]
+    names = [ "Ene", "ahc-x" ] + [ "anc-{}".format(float(tp)) for tp in T ]
+    with open(path, 'w') as f:
+        f.write(" ".join(names) + "\n")
+        np.savetxt(f, np.column_stack(cols), fmt='%14.6e')
+
+def plane(n):
+    #n×nのk点の平面. 内側の方向はky
+    kx, ky = np.meshgrid(np.linspace(-0.5, 0.5, n), np.linspace(-0.4, 0.4, n), indexing='ij')
+    return kx, ky
+
+def write_curv(path, n):
+    #Berry曲率のdat: 4行のheader, kx ky kz k1 k2 k3 Ox Oy Oz
+    kx, ky = plane(n)
+    r2 = kx**2 + ky**2 + 0.01
+    Om = np.stack([ kx/r2, ky/r2, 0.1/r2 ])
+    kp = np.stack([ kx, ky, np.zeros_like(kx) ])
+    data = np.concatenate([ kp, kp, Om ]).reshape(9, -1).T
+    with open(path, 'w') as f:
+        f.write("# a\n# b\n# c\n# kx ky kz k1 k2 k3 Ox Oy Oz\n")
+        np.savetxt(f, data, fmt='%14.8f')
+
+def write_bandplane(path, n, nband=8):
+    #bulkek_planeのdat: 1行のheader, 外側のk点ごとに空行で区切ったblock
+    kx, ky = plane(n)
+    kp = np.stack([ kx, ky, np.zeros_like(kx) ])
+    E = np.stack([ 0.3*np.cos(6*kx)*np.cos(6*ky) + 0.1*(b - nband/2) for b in range(nband) ])
+    data = np.concatenate([ kp, kp, E ]).transpose(1, 2, 0)
+    with open(path, 'w') as f:
+        f.write("# header\n")
+        for blk in data:
+            np.savetxt(f, blk, fmt='%12.6f')
+            f.write("\n")
+
+def gap_points(n, seed=0):
+    #BZ内に散らばった点と, nodal lineの周りに集まった点を混ぜたk点(3, n)
+    rng = np.random.default_rng(seed)
+    t = rng.uniform(0, 2*np.pi, n//2)
+    line = np.stack([ 0.3*np.cos(t), 0.3*np.sin(t), 0.05*np.sin(3*t) ]) + rng.normal(scale=0.005, size=(3, len(t)))
+    bulk = kcell.T @ rng.uniform(-0.5, 0.5, (3, n - len(t)))
+    return np.concatenate([ line, bulk ], axis=1)
+
+def write_gap(path, n, seed=0):
+    #bandgapのdat: 1行のheader, kx ky kz gap Ev Ec k1 k2 k3
+    rng = np.random.default_rng(seed)
+    K = gap_points(n, seed)
+    gap = np.abs(rng.normal(scale=0.03, size=n))
+    Ev = rng.uniform(-1, 0, n)
+    data = np.concatenate([ K, gap[None], Ev[None], (Ev+gap)[None], K ]).T
+    with open(path, 'w') as f:
+        f.write("# kx ky kz gap Ev Ec k1 k2 k3\n")
+        np.savetxt(f, data, fmt='%14.8f')
@@ -17,7 +17,8 @@ setup(
             'anccalc = wtplot.anccalc:main',
             'curv    = wtplot.curvplot:main',
             'bdgap   = wtplot.bandgapplot:main',
-            'bdplane = wtplot.band_plane_plot:main',
+            'bdplane = wtplot.bd_plane_plot:main',
+            'wtbatch = wtplot.batch:main',
         ],
     },
 )
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+import wtplot.anccalc as ac
+
+def grid(n=30, uniform=True):
+    Ene = np.linspace(-0.2, 0.2, n)
+    if not uniform: Ene = Ene + 0.3 * (Ene[1] - Ene[0]) * np.sin(7 * np.arange(n))
+    return Ene, 100 * np.tanh(Ene / 0.05) + 30 * np.sin(Ene / 0.03)
+
+@pytest.fixture(scope='module', params=[ True, False ], ids=[ 'uniform', 'nonuniform' ])
+def loop5(request):
+    #calc_anc_loopは遅いので5Kの参照値をgridごとに1回だけ計算する
+    Ene, AHC = grid(uniform=request.param)
+    return Ene, AHC, np.array(ac.calc_anc_loop(Ene, AHC, 5))
+
+def test_vector_matches_loop(loop5):
+    Ene, AHC, ref = loop5
+    np.testing.assert_allclose(ac.calc_anc(Ene, AHC, 5, 'vector'), ref, rtol=0, atol=1e-12 * np.abs(ref).max())
+
+@pytest.mark.parametrize('method', [ 'analytic', 'operator', 'conv' ])
+def test_closed_form_matches_loop(loop5, method):
+    #低温ではloopの10000点のmeshで十分なので, 閉じた式の重みと一致する
+    Ene, AHC, ref = loop5
+    if method == 'conv':
+        try: ac.uniform_step(Ene)
+        except ValueError: pytest.skip("conv needs a uniform grid")
+    np.testing.assert_allclose(ac.calc_anc(Ene, AHC, 5, method), ref, rtol=0, atol=1e-10 * np.abs(ref).max())
+
+@pytest.mark.parametrize('uniform', [ True, False ])
+@pytest.mark.parametrize('T', [ 5, 50, 300 ])
+def test_analytic_matches_adaptive(uniform, T):
+    #高温ではloopのmeshの誤差の方が大きいので, 誤差を抑えたadaptive法と比べる
+    Ene, AHC = grid(uniform=uniform)
+    ANC, nmesh, err = ac.calc_anc_adaptive(Ene, AHC, T, tol=1e-10)
+    np.testing.assert_allclose(ac.calc_anc(Ene, AHC, T, 'analytic'), ANC, rtol=0, atol=2e-10)
+    assert err.max() <= 1e-10
+
+@pytest.mark.parametrize('uniform, T, form', [
+    (True, 5, 'sparse'), (True, 300, 'conv'), (False, 300, 'dense') ])
+def test_operator_forms_and_save_load(tmp_path, uniform, T, form):
+    Ene, AHC = grid(uniform=uniform)
+    ref = ac.calc_anc_analytic(Ene, AHC, T)
+    op = ac.AncOperator.build(Ene, T)
+    assert op.form == form
+    np.testing.assert_allclose(op.apply(AHC), ref, rtol=0, atol=1e-11)
+
+    path = str(tmp_path / "op.npz")
+    op.save(path)
+    op2 = ac.AncOperator.load(path)
+    assert op2.form == form
+    assert op2.T == op.T
+    np.testing.assert_array_equal(op2.apply(AHC), op.apply(AHC))
+    #複数のAHCの列にまとめて掛けても列ごとと同じ
+    both = op2.apply(np.column_stack([ AHC, -AHC ]))
+    np.testing.assert_allclose(both[:, 1], -op.apply(AHC), rtol=0, atol=1e-15)
+
+def test_conv_map_matches_single():
+    Ene, AHC = grid()
+    m = ac.calc_anc_map(Ene, AHC, [ 10, 100 ])
+    for tp, row in zip([ 10, 100 ], m):
+        np.testing.assert_allclose(row, ac.calc_anc(Ene, AHC, tp, 'analytic'), rtol=0, atol=1e-11)
+
+@pytest.mark.parametrize('fmt', [ 'text', 'bin' ])
+def test_existing_anc_reused_only_for_same_method(tmp_path, capsys, fmt):
+    import wtplot.datio as datio
+    Ene, AHC = grid()
+    ahc = tmp_path / "ahc.txt"
+    with open(ahc, 'w') as f:
+        f.write("# header\n# E sxy syz szx\n# units\n")
+        for E, a in zip(Ene, AHC): f.write("{:.6f} {:.8e} {:.8e} {:.8e}\n".format(E, a, a, a))
+    out = str(tmp_path / "anc.dat")
+    run = lambda *opt: ac.main([ str(ahc), 'x', '-o', out, '-f', fmt ] + list(opt))
+
+    run('-t', '10-20', '-m', 'vector')
+    run('-t', '10-20-30', '-m', 'vector')
+    assert "reuse" in capsys.readouterr().out
+    assert datio.read_meta(out)["method"] == 'vector'
+
+    #方法が違えば今までの列は使わずに計算し直す
+    run('-t', '10-40', '-m', 'analytic')
+    assert "recompute" in capsys.readouterr().out
+    names = datio.read_table(out)[0]
+    assert [ n for n in names if n.startswith("anc-") ] == [ "anc-10.0", "anc-40.0" ]
+
+    run('-t', '10', '-m', 'adaptive', '--tol', '1e-6')
+    run('-t', '10-20', '-m', 'adaptive', '--tol', '1e-8')
+    assert capsys.readouterr().out.count("recompute") == 2
+    meta = datio.read_meta(out)
+    assert meta["method"] == 'adaptive' and float(meta["tol"]) == 1e-8
+    names = datio.read_table(out)[0]
+    assert [ n for n in names if n.startswith("nmesh-") ] == [ "nmesh-10.0", "nmesh-20.0" ]
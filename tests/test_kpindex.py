@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from wtplot.bandgapplot import Klimit
+from wtplot.kpindex import dedup_kpoints, lod_reduce, DedupIndex, LODGrid
+
+def mesh(n, a=0.5):
+    g = np.linspace(-a, a, n)
+    return np.array(np.meshgrid(g, g, g, indexing='ij')).reshape(3, -1)
+
+def test_dedup_replicated_boundary_points():
+    #BZの境界の点とその複製(逆格子だけずれた点)は1つにまとまる
+    K = mesh(21)
+    lim = (-0.6, 0.6)
+    K, E = Klimit(K, np.arange(K.shape[1], dtype=float), np.eye(3), lim, lim, lim, shift_num=1)
+    nuniq = len(np.unique(np.round(K, 9), axis=1).T)
+    assert K.shape[1] > nuniq
+    for tol in [ 1e-3, 1e-2, 2e-2 ]:
+        Kd, Ed = dedup_kpoints(K, E, tol)
+        assert Kd.shape == (3, nuniq)
+        assert len(Ed) == nuniq
+
+def test_dedup_keeps_first():
+    rng = np.random.default_rng(0)
+    A = rng.random((3, 3000))
+    K = np.hstack([ A, A + rng.normal(0, 1e-9, A.shape) ])
+    E = np.arange(K.shape[1], dtype=float)
+    Kd, Ed = dedup_kpoints(K, E, 1e-6)
+    np.testing.assert_array_equal(Kd, A)
+    np.testing.assert_array_equal(Ed, E[:3000])
+
+def test_dedup_keeps_distinct_points():
+    K = mesh(5)
+    Kd, Ed = dedup_kpoints(K, np.zeros(K.shape[1]), 1e-3)
+    assert Kd.shape == K.shape
+
+def test_lod_budget():
+    rng = np.random.default_rng(0)
+    K = rng.random((3, 20000))
+    Kr, Er = lod_reduce(K, K[0], 500)
+    assert 0 < len(Er) <= 500
+    assert Kr.shape == (3, len(Er))
+
+def test_lod_rejects_empty_budget():
+    K = np.random.default_rng(0).random((3, 100))
+    with pytest.raises(ValueError):
+        lod_reduce(K, K[0], 0)
+
+def test_dedup_index_matches_batch():
+    #blockごとに複製して追加しても, まとめてdedupしたのと同じ点が残る
+    X = mesh(21)
+    lim = (-0.6, 0.6)
+    E = np.arange(X.shape[1], dtype=float)
+    d = DedupIndex(1e-3)
+    parts = []
+    for blk in np.array_split(np.arange(X.shape[1]), 7):
+        parts.append(d.add(*Klimit(X[:, blk], E[blk], np.eye(3), lim, lim, lim, shift_num=1)))
+    Kw = np.hstack([ K for K, E in parts ])
+    Kb, Eb = dedup_kpoints(*Klimit(X, E, np.eye(3), lim, lim, lim, shift_num=1), 1e-3)
+    assert Kw.shape == Kb.shape
+    key = lambda K: np.unique(np.round(K, 9), axis=1)
+    np.testing.assert_array_equal(key(Kw), key(Kb))
+
+def test_lod_grid():
+    rng = np.random.default_rng(0)
+    K = rng.random((3, 20000))
+    E = rng.random(20000)
+    lod = LODGrid(500)
+    for blk in np.array_split(np.arange(20000), 9): lod.add(K[:, blk], E[blk])
+    assert lod.n.sum() == 20000
+    np.testing.assert_allclose(lod.sK.sum(axis=1), K.sum(axis=1))
+    Kr, Er = lod.points()
+    assert 0.5 * len(lod_reduce(K, E, 500)[1]) <= len(Er) <= 500
+    lod.clear()
+    assert lod.points()[0].shape == (3, 0)
@@ -1,5 +1,27 @@
-from wtplot.ahcplot import read_ahc_dat
-from wtplot.ancplot import read_anc_dat
-from wtplot.anccalc import calc_anc
-from wtplot.bandgapplot import read_gapdat, convertinBZ, copyKpoints, Klimit, plot_gapdat
 
+#submoduleは属性に初めてaccessしたときにimportする(PEP 562)。
+#import wtplotだけではmatplotlibやpandasを読み込まない
+import importlib
+
+_attrs = {
+    'read_ahc_dat': 'wtplot.ahcplot',
+    'read_anc_dat': 'wtplot.ancplot',
+    'calc_anc'    : 'wtplot.anccalc',
+    'read_gapdat' : 'wtplot.bandgapplot',
+    'convertinBZ' : 'wtplot.bandgapplot',
+    'copyKpoints' : 'wtplot.bandgapplot',
+    'Klimit'      : 'wtplot.bandgapplot',
+    'plot_gapdat' : 'wtplot.bandgapplot',
+}
+
+__all__ = list(_attrs)
+
+def __getattr__(name):
+    if name not in _attrs:
+        raise AttributeError("module 'wtplot' has no attribute '{}'".format(name))
+    value = getattr(importlib.import_module(_attrs[name]), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -1,31 +1,83 @@
 
 """
 Usage:
-    ahcplot.py <ahc_dat> <axis> [-r]
+    ahcplot.py <ahc_dat> <axis> [-r] [--watch] [--interval <sec>] [--idle <sec>] [-o <out>] [--dpi <dpi>] [--profile] [--profile-out <file>]
 
 Options:
     <ahc_dat>           wtで計算したahcのfile
     <axis>              x,y,z
     -r                  ahcの値の正負を反転する
+    --watch             計算中に書き足されていくahc_datを表示し続ける. 書き足された行だけを読む
+    --interval <sec>    --watchで描き直す最短の間隔 [default: 2]
+    --idle <sec>        --watchでこの秒数の間fileが増えなければ終わる(指定しないとwindowを閉じるかCtrl-Cまで)
+    -o <out>            figureを保存するfile(png, pdf, svgなど), 指定するとwindowを開かない
+    --dpi <dpi>         保存するfigureの解像度
+    --profile           処理ごとの時間, memory, 点の数を表示する
+    --profile-out <file>  処理ごとの記録をjson(.json)かcProfile(.prof)の形式で保存する
 """
 
 from docopt import docopt
-from matplotlib import pyplot as plt
-import plottool as pt
+import numpy as np
+import wtplot.datio as datio
+import wtplot.render as render
+import wtplot.profiling as profiling
+import wtplot.watch as watch
 
-pt.mpl_init()
+@profiling.profiled('read', points=lambda r, *a, **k: len(r[0]))
+def read_ahc_dat(file_ahc_dat, ahcrow, rv, dtype='f8'):
+    #binary形式(datio.text_to_bin(file, out, skiprows=3)で変換したもの)ならmemmapの列をそのまま返す
+    if datio.is_binary(file_ahc_dat):
+        names, data, meta = datio.read_bin(file_ahc_dat)
+        data = datio.as_dtype(data, dtype)
+    else:
+        data = datio.load_text(file_ahc_dat, skiprows=3, dtype=dtype)
+    if rv : return data[0], -data[ahcrow]
+    else  : return data[0], data[ahcrow]
 
-def read_ahc_dat(file_ahc_dat, ahcrow, rv):
-    with open(file_ahc_dat, 'r') as f_ahc_dat:
-        lines = [ l.split() for l in f_ahc_dat.readlines()[3:] ]
-    Ene = [ float(line[0]) for line in lines ]
-    if rv : AHC = [ -float(line[ahcrow]) for line in lines ]
-    else  : AHC = [ float(line[ahcrow]) for line in lines ]
-    return Ene, AHC
+def watch_ahc(args, ahcrow):
+    #書き足された行だけを読み, 描いた線のdataを差し替える
+    import plottool as pt
+    reader = watch.TailReader(args['<ahc_dat>'], skiprows=3)
+    buf = watch.ColumnBuffer()
+    sign = -1 if args['-r'] else 1
 
-def main():
-    args = docopt(__doc__)
+    def poll():
+        new, reset = reader.poll()
+        if reset: buf.clear()
+        if new is not None: buf.append(new)
+        return reset or new is not None
+
+    poll()
+    data = buf.data if len(buf) > 0 else np.empty((ahcrow+1, 0))
+    fig, ax = pt.MakeAxesTable([1], [1], width=16, height=16, margin=2.5)
+    pt.AHCplot(ax[0][0], data[0], sign * data[ahcrow])
+    line = ax[0][0].lines[-1]
+    ax[0][0].tick_params('x', labelsize=15)
+    ax[0][0].tick_params('y', labelsize=15)
+    ax[0][0].xaxis.label.set_size(20)
+    ax[0][0].yaxis.label.set_size(20)
+
+    def refresh():
+        #作り直されたfileをまだ読んでいなければ線を消す
+        if len(buf) == 0:
+            line.set_data([], [])
+            return
+        line.set_data(buf.data[0], sign * buf.data[ahcrow])
+        ax[0][0].relim()
+        ax[0][0].autoscale_view()
+
+    watch.watch(fig, poll, refresh, interval=float(args['--interval']), \
+                idle=float(args['--idle']) if args['--idle'] is not None else None, \
+                out=args['-o'], dpi=args['--dpi'])
+
+def main(argv=None):
+    args = docopt(__doc__, argv=argv)
+    profiling.setup(args['--profile'], args['--profile-out'])
+    if args['-o'] is not None: render.headless()
+    import plottool as pt
+    render.ensure_mpl_init()
     ahcrow = { 'x':2, 'y':3, 'z':1 }
+    if args['--watch']: return watch_ahc(args, ahcrow[args['<axis>']])
     Ene, AHC = read_ahc_dat(args['<ahc_dat>'], ahcrow[args['<axis>']], args['-r'])
     fig, ax = pt.MakeAxesTable([1], [1], width=16, height=16, margin=2.5)
     pt.AHCplot(ax[0][0], Ene, AHC)
@@ -33,7 +85,7 @@ def main():
     ax[0][0].tick_params('y', labelsize=15)
     ax[0][0].xaxis.label.set_size(20)
     ax[0][0].yaxis.label.set_size(20)
-    plt.show()
+    render.show(fig, args['-o'], args['--dpi'])
 
 if __name__ == '__main__': main()
 
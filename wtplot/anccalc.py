@@ -1,30 +1,54 @@
 
 """
 Usage:
-    anccalc.py <ahc_dat> <axis> [-t <T>] [-r] [-s <SAVE_PATH>]
+    anccalc.py <ahc_dat> <axis> [-t <T>] [-r] [-s <SAVE_PATH>] [-m <method>] [-j <jobs>] [--cache-dir <dir>] [--tol <tol>] [-o <anc_dat>] [-f <format>] [--profile] [--profile-out <file>]
 
 Options:
     <ahc_dat>       ahcの計算を行ったディレクトリ
-    <axis>          x,y,z
+    <axis>          x,y,z, "x,y,z"のように複数指定してもよい
     -t <T>          温度, "1-100-300"などと指定, いくつ指定してもよい [default:  1-100-300]
+                    "10:300:10"のように start:stop:step で範囲を指定してもよい(stopを含む)
     -r              ahcの値の正負を反転する
     -s <SAVE_PATH>  ancdatの出力名
+    -o <anc_dat>    ancdatの出力file. すでに存在し, 計算方法(-m, adaptive法では--tolも)と
+                    Ene, ahcの列が入力と一致すれば足りない温度だけを計算して追加する
+    -f <format>     ancdatの形式, text or bin(np.memmapで読めるbinary) [default: text]
+    -m <method>     積分の計算方法, vector, analytic, conv(等間隔のEneのみ), adaptive, loop(参照用の旧実装),
+                    operator(analyticの重みを疎行列にして, 複数のaxisにまとめて掛ける)
+                    [default: vector]
+    -j <jobs>       並列に計算するprocess数 [default: 1]
+    --cache-dir <dir>  温度ごとのkernel, operatorを.npzで保存, 再利用するdirectory
+    --tol <tol>     adaptive法でのANCの許容誤差. meshの点数と誤差の見積もりも出力する [default: 1e-6]
+    --profile       処理ごとの時間, memory, 点の数を表示する(-j 1のときは温度ごとの計算も)
+    --profile-out <file>  処理ごとの記録をjson(.json)かcProfile(.prof)の形式で保存する
 """
 
+import os
+import zipfile
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from docopt import docopt
 import numpy as np
-import pandas as pd
-from scipy.constants import *
+from scipy.constants import k, e, pi
 
-from matplotlib import pyplot as plt
-
-import plottool as pt
+#pandas, scipy.special, scipy.signalは使う関数の中でimportする
 import wtplot.ahcplot as wtahc
+import wtplot.datio as datio
+import wtplot.profiling as profiling
 
-pt.mpl_init()
 cosh_cutoff=200
+#analytic法で外挿部分を数値積分する範囲(減衰長のtail_reach倍)とGauss-Legendreの区間数, 点数
+tail_reach=40
+tail_panels=8
+tail_nodes=16
+#operator法で重みを残すmuからの距離(kT/e単位)。f'(u)はu=40でexp(-40)~4e-18になる
+op_cutoff=40
+#operator法で重みの残る割合がこれを超えると, 疎行列ではなくconv法のkernelかndarrayで持つ
+op_dense_fraction=0.5
 
-def calc_anc(Ene, AHC, T):
+def calc_anc_loop(Ene, AHC, T):
+    #回帰テスト用の参照実装。calc_ancのvector版はこれと数値的に一致する。
     beta=1/(k*T)
     #LはAHCの外挿の収束距離, 端のデータ点の振る舞いが変わる
     L=(Ene[1]-Ene[0])*5
@@ -93,25 +117,609 @@ def calc_anc(Ene, AHC, T):
 
     return ANC_list
 
-def main():
-    args = docopt(__doc__)
+def fermi_mesh(T, cutoff=cosh_cutoff):
+    #ε-μのmeshと, その上のdf/dε(β*eは除く)を作る。calc_anc_loopと同じ定義。
+    beta=1/(k*T)
+    ep_mu_max=((cutoff/beta)/e)
+    ep_step=ep_mu_max*2/10000
+    ep_mu_mesh=np.arange(-1*ep_mu_max, ep_mu_max, ep_step)
+    df_dep_mesh=-1/(2+2*np.cosh(beta*e*ep_mu_mesh))
+    return ep_mu_mesh, df_dep_mesh, ep_step
+
+def interp_ahc(ep, Ene, AHC, L):
+    #Eneの範囲内は線形に内挿, 範囲外は距離Lで指数収束する外挿によりAHCの値を得る
+    #epは任意のshapeのarrayでよい
+    sgm=np.interp(ep, Ene, AHC)
+
+    #εがすべてのEneより小さいとき
+    lo = ep < Ene[0]
+    if lo.any():
+        a=(AHC[1]-AHC[0])/(Ene[1]-Ene[0])
+        d=Ene[0]-ep[lo]
+        sgm[lo]=AHC[0]-a*d*np.exp(-d/L)
+
+    #εがすべてのEneより大きいとき
+    hi = ep > Ene[-1]
+    if hi.any():
+        a=(AHC[-1]-AHC[-2])/(Ene[-1]-Ene[-2])
+        d=ep[hi]-Ene[-1]
+        sgm[hi]=AHC[-1]+a*d*np.exp(-d/L)
+    return sgm
+
+def calc_anc_vector(Ene, AHC, T, chunk_size=2**22):
+    #calc_anc_loopをnumpyで書き直したもの。
+    #muごとのloopをやめ, (mu, ε-μ)の2次元配列で内挿と積分をまとめて行う。
+    #chunk_sizeは一度に作る2次元配列の要素数の上限で, メモリ使用量を抑える。
+    Ene=np.asarray(Ene, dtype=float)
+    AHC=np.asarray(AHC, dtype=float)
+    beta=1/(k*T)
+    L=(Ene[1]-Ene[0])*5
+
+    ep_mu_mesh, df_dep_mesh, ep_step = kernel_cache.get('mesh', T)
+    weight=ep_mu_mesh*df_dep_mesh
+
+    ANC=np.empty(len(Ene))
+    nmu=max(1, chunk_size//len(ep_mu_mesh))
+    for i in range(0, len(Ene), nmu):
+        ep_mesh=Ene[i:i+nmu, None]+ep_mu_mesh[None, :]
+        sgm_mesh=interp_ahc(ep_mesh, Ene, AHC, L)
+        ANC[i:i+nmu]=sgm_mesh@weight
+
+    ANC=ANC*ep_step*beta/T
+    ANC=ANC*100*e #eは分子に2つ分母に1つで1つ残る
+    return ANC
+
+def fermi_moments(u):
+    #u=β(ε-μ)e, fをFermi分布関数として
+    # F1(u)=∫u f'(u)du  = u f(u) + log(1+exp(-u))
+    # F2(u)=∫u^2 f'(u)du = u^2 f(u) + 2u log(1+exp(-u)) - 2 Li2(-exp(-u))
+    #u<0では exp(-u) があふれるので, F1は偶関数, F2(-u)=π^2/3-F2(u) を使って|u|で計算する。
+    #Li2(x)=spence(1-x)
+    from scipy.special import spence
+    v=np.abs(u)
+    ev=np.exp(-v)
+    f=ev/(1+ev)
+    l=np.log1p(ev)
+    F1=v*f+l
+    F2=v*v*f+2*v*l-2*spence(1+ev)
+    F2=np.where(u >= 0, F2, pi**2/3-F2)
+    return F1, F2
+
+def fermi_deriv(u):
+    #f'(u)=-1/(2+2cosh(u)), 大きな|u|でもあふれないように書いたもの
+    ev=np.exp(-np.abs(u))
+    return -ev/(1+ev)**2
+
+def tail_weights(dl, T, L):
+    #端からさらにdl(>=0)だけ離れたmuに対し, 外挿の指数部分 d*exp(-d/L)(dは端からの距離)の寄与
+    # 100*e*β/T * ∫ d exp(-d/L) (d+dl) f'(β(d+dl)e) dd
+    #をGauss-Legendreで数値積分する。被積分関数はmin(L, kT/e)程度の長さで滑らかに減衰する。
+    beta=1/(k*T)
+    lam=1/(1/L+beta*e)
+    x, w=np.polynomial.legendre.leggauss(tail_nodes)
+    edges=np.linspace(0, tail_reach*lam, tail_panels+1)
+    h=np.diff(edges)/2
+    d=((edges[:-1]+h)[:, None]+h[:, None]*x[None, :]).ravel()
+    w=(h[:, None]*w[None, :]).ravel()
+    dd=d[None, :]+np.asarray(dl)[:, None]
+    g=d*np.exp(-d/L)*w
+    return (dd*fermi_deriv(beta*e*dd))@g*100*e*beta/T
+
+def anc_weights(Ene, mu, T, L=None):
+    #AHCを節点Ene上の区分線形関数(端の外側は指数収束する外挿)として, ANC(mu)=W@AHC となる重みWを返す。
+    #shapeは(len(mu), len(Ene))
+    #各区間でσ(ε)=σ_j(1-t)+σ_j+1 t, t=(u-u_j)/(u_j+1-u_j) として
+    # ∫u f'du = ΔF1, ∫t u f'du = (ΔF2-u_j ΔF1)/Δu
+    #を使う。端より外側の一定部分はF1(±∞)=0 より端の節点に±F1(u)が加わる。
+    #係数は 100*e*β/T * (1/(βe))^2 = 100*k/e
+    #外挿の指数部分は端の傾きaに比例するので, tail_weightsの値を端の2点に振り分ける。
+    #L: 外挿の収束距離, 指定しないと(Ene[1]-Ene[0])*5
+    Ene=np.asarray(Ene, dtype=float)
+    mu=np.asarray(mu, dtype=float)
+    beta=1/(k*T)
+    if L is None: L=(Ene[1]-Ene[0])*5
+    u=beta*e*(Ene[None, :]-mu[:, None])
+    F1, F2=fermi_moments(u)
+    dF1=np.diff(F1, axis=1)
+    dF2=np.diff(F2, axis=1)
+    I1=(dF2-u[:, :-1]*dF1)/np.diff(u, axis=1)
+
+    W=np.zeros_like(u)
+    W[:, :-1]+=dF1-I1
+    W[:, 1:]+=I1
+    W[:, 0]+=F1[:, 0]
+    W[:, -1]-=F1[:, -1]
+    W=W*100*k/e
+
+    #εがすべてのEneより小さい側: σ=AHC[0]-a*d*exp(-d/L), ε-μ=-(d+dl)
+    C=tail_weights(mu-Ene[0], T, L)/(Ene[1]-Ene[0])
+    W[:, 0]-=C
+    W[:, 1]+=C
+    #εがすべてのEneより大きい側: σ=AHC[-1]+a*d*exp(-d/L), ε-μ=d+dl
+    C=tail_weights(Ene[-1]-mu, T, L)/(Ene[-1]-Ene[-2])
+    W[:, -1]+=C
+    W[:, -2]-=C
+    return W
+
+def anc_window(Ene, mu, T, cutoff=op_cutoff):
+    #muごとに重みを残す節点の範囲[lo, hi)。muからcutoff*kT/eより遠い節点ではf'~exp(-cutoff)なので捨てる。
+    #区間の積分のため両側に1点ずつ広げる
+    reach=cutoff*k*T/e
+    lo=np.maximum(np.searchsorted(Ene, mu-reach, 'left')-1, 0)
+    hi=np.minimum(np.searchsorted(Ene, mu+reach, 'right')+1, len(Ene))
+    return lo, hi
+
+def anc_weight_blocks(Ene, mu, T, cutoff=op_cutoff, chunk_size=2**20):
+    #muを近いものどうしまとめ, まとまりごとに (muの番号r, 節点の範囲の始めj0, 重みWc) を返すgenerator。
+    #Wcはanc_weightsを節点Ene[j0:j0+Wc.shape[1]]だけで計算したもので, ANC(mu[r])=Wc@AHC[j0:j1]
+    #範囲の端の項はmuからcutoff*kT/e以上離れているので無視できる
+    Ene=np.asarray(Ene, dtype=float)
+    mu=np.asarray(mu, dtype=float)
+    L=(Ene[1]-Ene[0])*5
+    lo, hi=anc_window(Ene, mu, T, cutoff)
+    order=np.argsort(mu, kind='stable')
+    nmu=max(1, min(chunk_size//max(int((hi-lo).max()), 1), int(np.sqrt(chunk_size))))
+    for i in range(0, len(mu), nmu):
+        r=order[i:i+nmu]
+        j0, j1=lo[r].min(), hi[r].max()
+        yield r, j0, anc_weights(Ene[j0:j1], mu[r], T, L=L)
+
+def calc_anc_analytic(Ene, AHC, T, chunk_size=2**20):
+    #AHCが節点間で線形であることを使い, 各区間の積分をFermi分布のmomentの閉じた式で行う。
+    #meshを切らないので計算量は節点数だけで決まり, 低温でも離散化誤差がない。
+    #muごとにop_cutoff*kT/e以内の節点だけを使うので, 低温では節点数にほぼ比例する。
+    Ene=np.asarray(Ene, dtype=float)
+    AHC=np.asarray(AHC, dtype=float)
+    ANC=np.empty(len(Ene))
+    for r, j0, Wc in anc_weight_blocks(Ene, Ene, T, chunk_size=chunk_size):
+        ANC[r]=Wc@AHC[j0:j0+Wc.shape[1]]
+    return ANC
+
+class AncOperator:
+    #Ene, Tを固定したときの ANC(mu)=W@AHC の重みW(len(mu), len(Ene))を持つ。
+    #Wはanalytic法と同じもので, muからop_cutoff*kT/eより遠い節点の重みは捨てる。
+    #高温では帯が節点の範囲全体に広がるので, 重みの残る割合がop_dense_fractionを超えるときは
+    # Eneが等間隔でmu=Eneなら, WはToeplitzなのでconv法と同じkernelだけを持つ
+    # それ以外はndarrayで持つ
+    #AHCの列を並べた(len(Ene), K)のarrayにまとめて掛けられ, save/loadで別のprocessでも使い回せる。
+    def __init__(self, Ene, mu, T, W=None, kernel=None):
+        self.Ene = np.asarray(Ene, dtype=float)
+        self.mu = np.asarray(mu, dtype=float)
+        self.T = float(T)
+        self.W = W.tocsr() if hasattr(W, 'tocsr') else W
+        self.kernel = kernel
+
+    @property
+    def form(self):
+        if self.kernel is not None: return 'conv'
+        if isinstance(self.W, np.ndarray): return 'dense'
+        return 'sparse'
+
+    @property
+    def nnz(self):
+        #持っている重みの数
+        if self.kernel is not None: return len(self.kernel)
+        if isinstance(self.W, np.ndarray): return self.W.size
+        return self.W.nnz
+
+    @classmethod
+    def build(cls, Ene, T, mu=None, cutoff=op_cutoff, chunk_size=2**20):
+        #mu: ANCを求めるμ, 指定しないとEneと同じ
+        from scipy import sparse
+        Ene = np.asarray(Ene, dtype=float)
+        mu_ = Ene if mu is None else np.asarray(mu, dtype=float)
+        N = len(Ene)
+        lo, hi = anc_window(Ene, mu_, T, cutoff)
+        nnz = int((hi-lo).sum())
+
+        if nnz > op_dense_fraction*len(mu_)*N:
+            if mu is None:
+                try: dE = uniform_step(Ene)
+                except ValueError: dE = None
+                if dE is not None:
+                    return cls(Ene, mu_, T, kernel=kernel_cache.get('conv', T, dE, cutoff)[0])
+            W = np.zeros((len(mu_), N))
+            for r, j0, Wc in anc_weight_blocks(Ene, mu_, T, cutoff, chunk_size):
+                W[r, j0:j0+Wc.shape[1]] = Wc
+            return cls(Ene, mu_, T, W)
+
+        #CSRの配列を先に確保し, muごとの帯[lo, hi)の重みをまとまりごとに書き込む
+        indptr = np.concatenate([ [0], np.cumsum(hi-lo) ])
+        indices = np.empty(nnz, dtype=np.int64)
+        data = np.empty(nnz)
+        for r, j0, Wc in anc_weight_blocks(Ene, mu_, T, cutoff, chunk_size):
+            j = np.arange(j0, j0+Wc.shape[1])
+            ir, jc = np.nonzero((j[None, :] >= lo[r][:, None]) & (j[None, :] < hi[r][:, None]))
+            pos = indptr[r[ir]] + j[jc] - lo[r[ir]]
+            indices[pos] = j[jc]
+            data[pos] = Wc[ir, jc]
+        W = sparse.csr_matrix((data, indices, indptr), shape=(len(mu_), N))
+        return cls(Ene, mu_, T, W)
+
+    def apply(self, AHC):
+        #AHC: (len(Ene),) もしくは列ごとにAHCを並べた(len(Ene), K), 返り値は(len(mu),) もしくは(len(mu), K)
+        AHC = np.asarray(AHC, dtype=float)
+        if AHC.shape[0] != len(self.Ene):
+            raise ValueError("AHC has {} rows but the operator was built for {} energies".format(
+                AHC.shape[0], len(self.Ene)))
+        if self.kernel is not None:
+            return conv_anc(self.Ene, AHC, self.T, self.kernel)
+        return np.asarray(self.W @ AHC)
+
+    __matmul__ = apply
+
+    def save(self, path):
+        arrays = { 'Ene': self.Ene, 'mu': self.mu, 'T': self.T }
+        if self.kernel is not None: arrays['kernel'] = self.kernel
+        elif isinstance(self.W, np.ndarray): arrays['W'] = self.W
+        else:
+            arrays.update(shape=self.W.shape, data=self.W.data, indices=self.W.indices, indptr=self.W.indptr)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        from scipy import sparse
+        with np.load(path) as npz:
+            if 'kernel' in npz.files:
+                return cls(npz['Ene'], npz['mu'], npz['T'].item(), kernel=npz['kernel'])
+            if 'W' in npz.files:
+                return cls(npz['Ene'], npz['mu'], npz['T'].item(), npz['W'])
+            W = sparse.csr_matrix((npz['data'], npz['indices'], npz['indptr']), shape=tuple(npz['shape']))
+            return cls(npz['Ene'], npz['mu'], npz['T'].item(), W)
+
+@profiling.profiled('anc_operator', nnz=lambda r, *a, **k: r.nnz)
+def anc_operator(Ene, T, cache_dir=None, cutoff=op_cutoff):
+    #AncOperator.buildと同じもの。cache_dirを指定すると(Ene, T, cutoff)ごとに.npzで保存し, 次回からは読み込む。
+    #同じエネルギーwindowで計算した別の物質のAHCにも同じoperatorが使える
+    if cache_dir is None: return AncOperator.build(Ene, T, cutoff=cutoff)
+    Ene = np.asarray(Ene, dtype=float)
+    key = hashlib.sha1(np.round(Ene, 9).tobytes() + repr((float(T), float(cutoff))).encode()).hexdigest()[:20]
+    path = os.path.join(cache_dir, "op-{}.npz".format(key))
+    if os.path.exists(path):
+        #壊れたfileは無いものとして作り直す
+        try: op = AncOperator.load(path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile): op = None
+        if op is not None and len(op.Ene) == len(Ene) and np.allclose(op.Ene, Ene, rtol=0, atol=1e-9) \
+           and op.T == float(T):
+            return op
+    op = AncOperator.build(Ene, T, cutoff=cutoff)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = "{}.{}.tmp.npz".format(path[:-4], os.getpid())
+    op.save(tmp)
+    os.replace(tmp, path)
+    return op
+
+def uniform_step(Ene, rtol=1e-3):
+    #Eneが等間隔ならその刻みを返す。wtの出力は桁数が丸められているので多少のずれは許す
+    Ene=np.asarray(Ene, dtype=float)
+    dE=(Ene[-1]-Ene[0])/(len(Ene)-1)
+    if np.abs(np.diff(Ene)-dE).max() > rtol*abs(dE):
+        raise ValueError("Ene is not a uniform grid")
+    return dE
+
+def conv_kernel(T, dE, cutoff=cosh_cutoff):
+    #等間隔(刻みdE)の節点で, 節点がmuからm個離れたときのanc_weightsの重みw_m(m=-M..M)
+    #anc_weightsと同じ式を, u=m*β*dE*e の点だけで計算したもの。|u|>cutoffの寄与は無視する
+    c=e*dE/(k*T)
+    M=int(np.ceil(cutoff/c))
+    u=np.arange(-M-1, M+2)*c
+    F1, F2=fermi_moments(u)
+    dF1=np.diff(F1)
+    I1=(np.diff(F2)-u[:-1]*dF1)/c
+    return (I1[:-1]+(dF1-I1)[1:])*100*k/e
+
+class KernelCache:
+    #温度ごとのkernel(fermi_meshのmesh, conv_kernelの重み)を(kind, T, dE, cutoff)をkeyとして保持する。
+    #memory上ではmaxsize個までのLRU, cache_dirを指定するとそこに.npzとして保存し次回以降読み込む。
+    builders = {
+        'mesh': lambda T, dE, cutoff: fermi_mesh(T, cutoff),
+        'conv': lambda T, dE, cutoff: (conv_kernel(T, dE, cutoff),),
+    }
+
+    def __init__(self, maxsize=64, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.kernels = OrderedDict()
+
+    def key(self, kind, T, dE=None, cutoff=cosh_cutoff):
+        #dEはAHCのfileごとに末尾の桁がずれるので丸めてからkeyにする
+        if dE is not None: dE = float("{:.12g}".format(dE))
+        return (kind, float(T), dE, float(cutoff))
+
+    def path(self, key):
+        name = hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+        return os.path.join(self.cache_dir, "{}-{}.npz".format(key[0], name))
+
+    def get(self, kind, T, dE=None, cutoff=cosh_cutoff):
+        key = self.key(kind, T, dE, cutoff)
+        if key in self.kernels:
+            self.kernels.move_to_end(key)
+            return self.kernels[key]
+
+        arrays = None
+        if self.cache_dir is not None and os.path.exists(self.path(key)):
+            #壊れたfileは無いものとして作り直す
+            try:
+                with np.load(self.path(key)) as npz:
+                    if npz['key'].item() == repr(key):
+                        arrays = tuple(npz['a{}'.format(i)] for i in range(len(npz.files)-1))
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile): arrays = None
+        if arrays is None:
+            arrays = tuple(np.asarray(a) for a in self.builders[kind](*key[1:]))
+            if self.cache_dir is not None: self.save(key, arrays)
+        for a in arrays: a.flags.writeable = False
+
+        self.kernels[key] = arrays
+        while len(self.kernels) > self.maxsize:
+            self.kernels.popitem(last=False)
+        return arrays
+
+    def save(self, key, arrays):
+        #別のprocessが書きかけのfileを読まないように, 一時fileに書いてから置き換える
+        path = self.path(key)
+        tmp = "{}.{}.tmp.npz".format(path[:-4], os.getpid())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.savez(tmp, key=repr(key), **{ 'a{}'.format(i): a for i, a in enumerate(arrays) })
+            os.replace(tmp, path)
+        except OSError: pass
+
+    def clear(self):
+        self.kernels.clear()
+
+kernel_cache = KernelCache()
+
+@profiling.profiled('calc_anc_map', points=lambda r, Ene, *a, **k: len(Ene), temperatures=lambda r, *a, **k: len(r))
+def calc_anc_map(Ene, AHC, T, method='conv'):
+    #複数の温度のANCをまとめて計算し, (len(T), len(Ene))のarrayで返す。
+    #conv法では温度ごとのkernel(kernel_cacheで使い回す)との畳み込みを行う。
+    if method != 'conv':
+        return np.array([ calc_anc(Ene, AHC, tp, method=method) for tp in T ])
+
+    Ene=np.asarray(Ene, dtype=float)
+    AHC=np.asarray(AHC, dtype=float)
+    dE=uniform_step(Ene)
+    return np.array([ conv_anc(Ene, AHC, tp, kernel_cache.get('conv', tp, dE)[0]) for tp in T ])
+
+def conv_anc(Ene, AHC, T, w):
+    #等間隔のEneで, conv_kernelの重みwとの畳み込みでANCを求める。AHCは(N,)か列を並べた(N, K)
+    #端の外側はAHCの端の値で延長し, 外挿の指数部分はanalytic法と同じく端の2点への補正で入れる。
+    from scipy import signal
+    AHC2=AHC.reshape(len(Ene), -1)
+    L=(Ene[1]-Ene[0])*5
+    M=len(w)//2
+    sgm=np.concatenate([ np.repeat(AHC2[:1], M, axis=0), AHC2, np.repeat(AHC2[-1:], M, axis=0) ])
+    ANC=signal.convolve(sgm, w[::-1, None], mode='valid')
+    ANC+=np.outer(tail_weights(Ene-Ene[0], T, L)/(Ene[1]-Ene[0]), AHC2[1]-AHC2[0])
+    ANC+=np.outer(tail_weights(Ene[-1]-Ene, T, L)/(Ene[-1]-Ene[-2]), AHC2[-1]-AHC2[-2])
+    return ANC.reshape(AHC.shape)
+
+def calc_anc_conv(Ene, AHC, T):
+    return calc_anc_map(Ene, AHC, [T], method='conv')[0]
+
+def calc_anc_adaptive(Ene, AHC, T, tol=1e-6, nmin=64, nmax=2**20, chunk_size=2**22):
+    #許容誤差tolを満たすように積分範囲とmeshをmuごとに決める。
+    #u=β(ε-μ)eとして ANC=100*k/e * ∫σ(μ+u/(βe)) u f'(u) du を [-U, U] の台形則で計算する。
+    # 積分範囲: |u f'(u)| <= u exp(-u) なので, 範囲の外の寄与は
+    #           (範囲の左側での|σ|の上限 + 右側での|σ|の上限) * (U+1)exp(-U) 以下。
+    #           |σ|の上限はmuごとに範囲の端より外側の節点と外挿から求め, これがtol/2以下になる一番小さいUを選ぶ
+    # mesh: AHCの刻み程度の間隔から始めて, muごとに区間数を倍にしていき,
+    #       変化から見積もった誤差 |I_2n-I_n|/3 が2回続けてtol/2以下になれば止める
+    #muごとのANC, 最終的なmeshの区間数, 誤差の見積もり(範囲外の寄与を含む)を返す。
+    Ene=np.asarray(Ene, dtype=float)
+    AHC=np.asarray(AHC, dtype=float)
+    be=e/(k*T)
+    L=(Ene[1]-Ene[0])*5
+    fac=100*k/e
+
+    #外挿部分 a*d*exp(-d/L) の大きさは a*L/e 以下
+    aL=abs((AHC[1]-AHC[0])/(Ene[1]-Ene[0]))*L/np.e
+    aR=abs((AHC[-1]-AHC[-2])/(Ene[-1]-Ene[-2]))*L/np.e
+    #Sl[i]: Ene[i]より左での|σ|の上限, Sr[j]: Ene[j]より右での|σ|の上限
+    Sl=np.maximum.accumulate(np.abs(AHC))+aL
+    Sr=np.maximum.accumulate(np.abs(AHC)[::-1])[::-1]+aR
+    def trunc(mu, U):
+        i=np.clip(np.searchsorted(Ene, mu-U/be, 'left'), 0, len(Ene)-1)
+        j=np.clip(np.searchsorted(Ene, mu+U/be, 'right')-1, 0, len(Ene)-1)
+        return fac*(Sl[i]+Sr[j])*(U+1)*np.exp(-U)
+    Umu=np.ones(len(Ene))
+    while True:
+        over=trunc(Ene, Umu) > tol/2
+        if not over.any(): break
+        Umu[over]+=1
+
+    def integrand_sum(mu, u, w):
+        #重みwをつけた sum_u σ(μ+u/βe) u f'(u) w をmuごとに計算する
+        out=np.empty(len(mu))
+        nmu=max(1, chunk_size//len(u))
+        for i in range(0, len(mu), nmu):
+            sgm=interp_ahc(mu[i:i+nmu, None]+u[None, :]/be, Ene, AHC, L)
+            out[i:i+nmu]=sgm@(u*fermi_deriv(u)*w)
+        return out
+
+    ANC=np.empty(len(Ene))
+    nmesh=np.empty(len(Ene), dtype=int)
+    err=np.empty(len(Ene))
+
+    #同じUのmuをまとめてmeshを細かくしていく
+    for U in np.unique(Umu):
+        idx=np.flatnonzero(Umu == U)
+        #meshの間隔がAHCの刻みより粗いと, 変化が偶然小さくなって止まることがある
+        n=max(nmin, 2**int(np.ceil(np.log2(2*U/be/np.diff(Ene).min()))))
+        h=2*U/n
+        u=np.linspace(-U, U, n+1)
+        w=np.full(n+1, h)
+        w[[0, -1]]=h/2
+        I=integrand_sum(Ene[idx], u, w)
+        active=idx
+        passed=np.zeros(len(idx), dtype=bool)
+
+        while len(active) > 0:
+            #台形則の区間を半分にし, 新しく加わる中点だけを計算する
+            n*=2
+            h/=2
+            unew=-U+h*(2*np.arange(n//2)+1)
+            I2=I/2+integrand_sum(Ene[active], unew, h)
+            est=fac*np.abs(I2-I)/3
+            ok=est <= tol/2
+            done=(ok & passed) | (n >= nmax)
+            ANC[active[done]]=fac*I2[done]
+            nmesh[active[done]]=n
+            err[active[done]]=est[done]+trunc(Ene[active[done]], U)
+            active=active[~done]
+            passed=ok[~done]
+            I=I2[~done]
+
+    return ANC, nmesh, err
+
+calc_anc_methods = {
+    'vector': calc_anc_vector,
+    'analytic': calc_anc_analytic,
+    'operator': lambda Ene, AHC, T: anc_operator(Ene, T).apply(AHC),
+    'conv': calc_anc_conv,
+    'adaptive': lambda Ene, AHC, T: calc_anc_adaptive(Ene, AHC, T)[0],
+    'loop': calc_anc_loop,
+}
+
+@profiling.profiled('calc_anc', points=lambda r, *a, **k: len(r))
+def calc_anc(Ene, AHC, T, method='vector'):
+    if method not in calc_anc_methods:
+        raise ValueError("unknown method: {} (choose from {})".format(
+            method, ", ".join(calc_anc_methods)))
+    return np.asarray(calc_anc_methods[method](Ene, AHC, T), dtype=float)
+
+def parse_temperature(spec):
+    #"1-100-300"のように'-'で区切った温度のlist, 各要素は"10:300:10"のような範囲でもよい
+    T=[]
+    for tk in spec.strip().split('-'):
+        if ':' in tk:
+            start, stop, step=[ float(x) for x in tk.split(':') ]
+            T.extend(np.arange(start, stop+step/2, step).tolist())
+        else: T.append(float(tk))
+    return list(dict.fromkeys(T))
+
+def anc_column(axes, ax, tp, prefix="anc"):
+    #ancdatの列名。axisが1つのときは従来通り"anc-T", 複数のときは"anc-axis-T"
+    #adaptive法ではmeshの区間数"nmesh-T"と誤差の見積もり"err-T"の列も同じ形で作る
+    if len(axes) == 1: return "{}-{}".format(prefix, tp)
+    return "{}-{}-{}".format(prefix, ax, tp)
+
+def anc_meta(method, tol):
+    #ancdatに書く計算方法。adaptive法では許容誤差も書く
+    if method == 'adaptive': return { "method": method, "tol": tol }
+    return { "method": method }
+
+def read_existing_anc(datname, Ene, AHC, meta):
+    #既存のancdatを読み, 計算方法(meta)とEneとahcの列が今回と一致すればDataFrameを返す。そうでなければNone
+    #text形式のancdatはto_stringで桁が丸められているので, 一致は丸めの分だけ許して判定する
+    #計算方法の書かれていない古いancdatは使わない
+    if not os.path.exists(datname): return None
+    import pandas as pd
+    old_meta = datio.read_meta(datname)
+    if old_meta.get("method") != meta["method"] or \
+       ("tol" in meta and float(old_meta.get("tol", "nan")) != meta["tol"]):
+        print("{} was computed with {}, recompute".format(datname, \
+              " ".join("{}={}".format(*kv) for kv in old_meta.items()) or "unknown method"))
+        return None
+    names, data = datio.read_table(datname)
+    old = pd.DataFrame({ n: np.array(d) for n, d in zip(names, data) })
+    ahccols = [ "ahc-{}".format(ax) for ax in AHC ]
+    if [ c for c in old.columns if c.startswith("ahc-") ] != ahccols: return None
+    if len(old) != len(Ene): return None
+    for col, v in [ ("Ene", Ene) ] + list(zip(ahccols, AHC.values())):
+        if not np.allclose(old[col].to_numpy(dtype=float), v, rtol=1e-5, atol=1e-6): return None
+    return old
+
+def anc_job(Ene, AHC, T, method, cache_dir=None, tol=1e-6):
+    #AHC: 列ごとにAHCを並べた(len(Ene), K)のarray
+    #温度ごと, 列ごとに(ANC,)もしくはadaptive法なら(ANC, nmesh, err)を返す
+    kernel_cache.cache_dir = cache_dir
+    AHC = np.asarray(AHC, dtype=float).reshape(len(Ene), -1)
+    if method == 'operator':
+        return [ [ (anc,) for anc in anc_operator(Ene, tp, cache_dir).apply(AHC).T ] for tp in T ]
+    if method == 'adaptive':
+        return [ [ calc_anc_adaptive(Ene, a, tp, tol=tol) for a in AHC.T ] for tp in T ]
+    maps = [ calc_anc_map(Ene, a, T, method=method) for a in AHC.T ]
+    return [ [ (m[i],) for m in maps ] for i in range(len(T)) ]
+
+def split_jobs(T, nchunk):
+    #温度のlistをnchunk個に分ける。conv法は1つのjob内で温度をまとめて計算できる
+    nchunk=max(1, min(nchunk, len(T)))
+    return [ list(c) for c in np.array_split(np.array(T), nchunk) ]
+
+def main(argv=None):
+    args = docopt(__doc__, argv=argv)
+    profiling.setup(args['--profile'], args['--profile-out'])
+    import pandas as pd
     print(args)
-    T = [ float(t) for t in args['-t'].split('-') ]
+    T = parse_temperature(args['-t'])
+    axes = args['<axis>'].split(',')
+    njob = int(args['-j'])
+    tol = float(args['--tol'])
     ahcrow = { 'x':2, 'y':3, 'z':1 }
-    Ene, AHC = wtahc.read_ahc_dat(args['<ahc_dat>'], ahcrow[args['<axis>']], args['-r'])
+    AHC = {}
+    for ax in axes:
+        Ene, AHC[ax] = wtahc.read_ahc_dat(args['<ahc_dat>'], ahcrow[ax], args['-r'])
+
+    axname = "".join(axes)
+    if args['-o'] is not None:
+        datname = args['-o']
+    elif args['-s'] is None:
+        datname = "anc_{}_{}.dat".format(axname, args['-t'])
+    else: datname = "{}-anc_{}_{}.dat".format(args['-s'], axname, args['-t'])
+
+    #既存のancdatがあれば, そこにない温度だけを計算する
+    meta = anc_meta(args['-m'], tol)
+    df = read_existing_anc(datname, Ene, AHC, meta)
+    if df is None:
+        df = pd.DataFrame(data = Ene, columns = ["Ene"])
+        for ax in axes:
+            df["ahc-{}".format(ax)] = AHC[ax]
+    else: print("reuse {}".format(datname))
+    Tall = {}
+    for ax in axes:
+        prefix = anc_column(axes, ax, "")
+        Tall[ax] = [ float(c.replace(prefix, "")) for c in df.columns if c.startswith(prefix) ]
+    todo = { ax: [ tp for tp in T if tp not in Tall[ax] ] for ax in axes }
+    if not any(todo.values()):
+        print("{} is up to date".format(datname))
+        return
 
-    if args['-s'] is None:
-        datname = "anc_{}_{}.dat".format(args['<axis>'], args['-t'])
-    else: datname = "{}-anc_{}_{}.dat".format(args['-s'], args['<axis>'], args['-t'])
+    #計算する温度が同じaxisはまとめ, (axisのまとまり, 温度のまとまり)ごとのjobに分ける。結果は投入した順に並べる
+    groups = {}
+    for ax in axes:
+        if todo[ax]: groups.setdefault(tuple(todo[ax]), []).append(ax)
+    jobs = [ (axg, Tc) for Tg, axg in groups.items() \
+                       for Tc in split_jobs(list(Tg), -(-njob//len(groups))) ]
+    stack = lambda axg: np.column_stack([ AHC[ax] for ax in axg ])
+    if njob > 1:
+        with ProcessPoolExecutor(max_workers=njob) as ex:
+            futures = [ ex.submit(anc_job, Ene, stack(axg), Tc, args['-m'], args['--cache-dir'], tol) for axg, Tc in jobs ]
+            results = [ f.result() for f in futures ]
+    else:
+        results = [ anc_job(Ene, stack(axg), Tc, args['-m'], args['--cache-dir'], tol) for axg, Tc in jobs ]
+    for (axg, Tc), res in zip(jobs, results):
+        for tp, rT in zip(Tc, res):
+            for ax, r in zip(axg, rT):
+                for prefix, v in zip([ "anc", "nmesh", "err" ], r):
+                    df[anc_column(axes, ax, tp, prefix)] = v
+        for ax in axg: Tall[ax].extend(Tc)
+        print("axis {} Temperature {} end".format(",".join(axg), "-".join(str(tp) for tp in Tc)))
 
-    df = pd.DataFrame(data = Ene, columns = ["Ene"])
-    df["ahc-{}".format(args['<axis>'])] = AHC
-    for tp in T:
-        df["anc-{}".format(tp)] = calc_anc(Ene, AHC, tp)
-        print("Temperature {} end".format(tp))
+    #列の順番は Ene, ahc, anc, nmesh, err で, それぞれaxisごとに既存の温度, 追加した温度の順
+    cols = [ "Ene" ] + [ "ahc-{}".format(ax) for ax in axes ]
+    for prefix in [ "anc", "nmesh", "err" ]:
+        cols += [ anc_column(axes, ax, tp, prefix) for ax in axes for tp in Tall[ax] \
+                  if anc_column(axes, ax, tp, prefix) in df.columns ]
+    df = df[cols]
 
-    with open (datname, 'w') as f: 
-        f.write(df.to_string(index=False))
+    with profiling.Stage('write', columns=len(df.columns), rows=len(df)):
+        if args['-f'] == 'bin':
+            datio.write_bin(datname, df.columns, [ df[c].to_numpy() for c in df.columns ], meta=meta)
+        else:
+            with open (datname, 'w') as f: 
+                f.write("# {}\n".format(" ".join("{}={}".format(*kv) for kv in meta.items())))
+                f.write(df.to_string(index=False))
 
 
 if __name__ == '__main__': main()
@@ -1,37 +1,54 @@
 
 """
 Usage:
-    ancplot.py <anc_dat> [-t <T>] [-r] [-n|--noahc]
+    ancplot.py <anc_dat> [-t <T>] [-r] [-n|--noahc] [-a <axis>] [-o <out>] [--dpi <dpi>] [--profile] [--profile-out <file>]
 
 Options:
     <anc_dat>           wtで計算したancのfile
     -t <desplayT>       表示する温度の指定(指定しないとすべて表示)
     -r                  ahcの値の正負を反転する
     -n --noahc          ahcをplotしない
+    -a <axis>           複数のaxisを含むancdatで表示するaxis(指定しないと最初のaxis)
+    -o <out>            figureを保存するfile(png, pdf, svgなど), 指定するとwindowを開かない
+    --dpi <dpi>         保存するfigureの解像度
+    --profile           処理ごとの時間, memory, 点の数を表示する
+    --profile-out <file>  処理ごとの記録をjson(.json)かcProfile(.prof)の形式で保存する
 """
 
 from docopt import docopt
-import numpy as np
-from matplotlib import pyplot as plt
-import plottool as pt
+import wtplot.datio as datio
+import wtplot.render as render
+import wtplot.profiling as profiling
 
-pt.mpl_init()
-
-def read_anc_dat(file_anc_dat, rv):
+@profiling.profiled('read', points=lambda r, *a, **k: len(r[0]))
+def read_anc_dat(file_anc_dat, rv, axis=None, dtype='f8'):
     #ancdatは1列目Ene, 2列目AHC, 3列目以降ANC
-    with open(file_anc_dat, 'r') as f_anc_dat:
-        index = f_anc_dat.readline().split()
-        lines = np.array([ l.split() for l in f_anc_dat.readlines() ], dtype=float)
-    T = [ float(ix.replace("anc-", "")) for ix in index[2:] ]
-    Ene = lines[:, 0]
-    if rv : AHC = lines[:, 1] * -1
-    else  : AHC = lines[:, 1]
-    ANC = { tp: lines[:, i+2] for i, tp in enumerate(T) }
+    #anccalcで複数のaxisを計算したときは"ahc-x", "anc-x-T"のような列が並ぶので, axisの列だけを取り出す
+    #text形式とbinary形式は自動で判別する。binary形式では各列はmemmapのまま返す
+    index, cols = datio.read_table(file_anc_dat, dtype=dtype)
+    ahccol = [ i for i, ix in enumerate(index) if ix.startswith("ahc-") ]
+    if axis is None: ia = ahccol[0]
+    else: ia = index.index("ahc-{}".format(axis))
+    ax = index[ia].replace("ahc-", "")
+    if len(ahccol) == 1: prefix = "anc-"
+    else: prefix = "anc-{}-".format(ax)
+    anccol = [ i for i, ix in enumerate(index) if ix.startswith(prefix) ]
+
+    T = [ float(index[i].replace(prefix, "")) for i in anccol ]
+    Ene = cols[0]
+    if rv : AHC = cols[ia] * -1
+    else  : AHC = cols[ia]
+    ANC = { tp: cols[i] for i, tp in zip(anccol, T) }
+    index = [ index[0], index[ia] ] + [ index[i] for i in anccol ]
     return Ene, AHC, ANC, T, index
 
-def main():
-    args = docopt(__doc__)
-    Ene, AHC, ANC, T, index = read_anc_dat(args['<anc_dat>'], args['-r'])
+def main(argv=None):
+    args = docopt(__doc__, argv=argv)
+    profiling.setup(args['--profile'], args['--profile-out'])
+    if args['-o'] is not None: render.headless()
+    import plottool as pt
+    render.ensure_mpl_init()
+    Ene, AHC, ANC, T, index = read_anc_dat(args['<anc_dat>'], args['-r'], axis=args['-a'])
 
     ### 表示するgraph数のカウント ###
     if args['-t'] is not None: 
@@ -78,7 +95,7 @@ def main():
             axc.xaxis.label.set_size(ls)
             axc.yaxis.label.set_size(ls)
             axc.annotate(title, (0.5, 1.01), xycoords='axes fraction', fontsize=ls, va='bottom', ha='center')
-    plt.show()
+    render.show(fig, args['-o'], args['--dpi'])
             ##########
 
 if __name__ == '__main__': main()
@@ -1,8 +1,8 @@
 
 """
 Usage:
-    bandgapplot.py <wt_in> [<gap_dat>...] [-x <xlim>] [-y <ylim>] [-z <zlim>] [-e <Enelim>] [-c <gap_cutoff>] [-m <markersize>]
-    bandgapplot.py <wt_in> [<gap_dat>...] [--bz] [-e <Enelim>] [-c <gap_cutoff>] [-m <markersize>]
+    bandgapplot.py <wt_in> [<gap_dat>...] [-x <xlim>] [-y <ylim>] [-z <zlim>] [-s <shift_num>] [-e <Enelim>] [-c <gap_cutoff>] [-m <markersize>] [-j <jobs>] [-d <tol>] [-b <budget>] [--compact] [--watch] [--interval <sec>] [--idle <sec>] [-o <out>] [--dpi <dpi>] [--profile] [--profile-out <file>]
+    bandgapplot.py <wt_in> [<gap_dat>...] [--bz] [-e <Enelim>] [-c <gap_cutoff>] [-m <markersize>] [-j <jobs>] [-d <tol>] [-b <budget>] [--compact] [--watch] [--interval <sec>] [--idle <sec>] [-o <out>] [--dpi <dpi>] [--profile] [--profile-out <file>]
 
 Options:
     <wt_in>             wt$B$N(Binput
@@ -11,104 +11,277 @@ Options:
     -x <xlim>           x$B:BI8$NHO0O(B, k$BE@$rJ#@=$7NN0h$rKd$a?T$/$9$h$&$KI=<((B
     -y <ylim>           y$B:BI8$NHO0O(B, k$BE@$rJ#@=$7NN0h$rKd$a?T$/$9$h$&$KI=<((B
     -z <zlim>           z$B:BI8$NHO0O(B, k$BE@$rJ#@=$7NN0h$rKd$a?T$/$9$h$&$KI=<((B
+    -s <shift_num>      k$BE@$rJ#@=$9$k$H$-(B, $B5U3J;R$r3FJ}8~$K!^$$$/$D$^$G$:$i$9$+(B  [default: 2]
     -e <Enelim>         gap$B$NB8:_$9$k(BEnergy$B$NHO0O(B, min,max$B$G;XDj(B  [default: -100,100 ]
     -c <gap_cutoff>     Energy gap$B$N(Bcutoff  [default: 0.02]
     -m <markersize>     $B%G!<%?E@$N(Bsize  [default: 2]
+    -j <jobs>           gap_dat$B$rJBNs$KFI$_9~$`(Bthread$B?t(B($B;XDj$7$J$$$H(Bcpu$B?t(B)
+    -d <tol>            $B5wN%(Btol$BDxEY0JFb$G=E$J$k(Bk$BE@$r(B1$B$D$K$^$H$a$F$+$iI=<((B
+    -b <budget>         $BI=<($9$kE@$N?t$N>e8B(B. $BD6$($kJ,$O(Bvoxel$B$4$H$NBeI=E@$K$^$H$a$k(B
+    --compact           k$BE@$H%G!<%?$r(Bfloat32$B$GFI$_9~$_(B, memory$B$rLsH>J,$K$9$k(B
+    --watch             $B7W;;Cf$K=q$-B-$5$l$F$$$/(Bgap_dat$B$rI=<($7B3$1$k(B. $B=q$-B-$5$l$?9T$@$1$rFI$_(B,
+                        $BJ#@=$J$I$O$=$N9T$K$@$19T$&(B. -x, -y, -z$B$G;XDj$7$J$$HO0O$O:G=i$KFI$s$@(Bk$BE@$NHO0O(B
+    --interval <sec>    --watch$B$GIA$-D>$9:GC;$N4V3V(B [default: 2]
+    --idle <sec>        --watch$B$G$3$NIC?t$N4V(Bfile$B$,A}$($J$1$l$P=*$o$k(B($B;XDj$7$J$$$H(Bwindow$B$rJD$8$k$+(BCtrl-C$B$^$G(B)
+    -o <out>            figure$B$rJ]B8$9$k(Bfile(png, pdf, svg$B$J$I(B), $B;XDj$9$k$H(Bwindow$B$r3+$+$J$$(B
+    --dpi <dpi>         $BJ]B8$9$k(Bfigure$B$N2rA|EY(B
+    --profile           $B=hM}$4$H$N;~4V(B, memory, $BE@$N?t$rI=<($9$k(B
+    --profile-out <file>  $B=hM}$4$H$N5-O?$r(Bjson(.json)$B$+(BcProfile(.prof)$B$N7A<0$GJ]B8$9$k(B
 
 """
-from docopt import docopt
+import os
+from concurrent.futures import ThreadPoolExecutor
+from docopt import docopt, DocoptExit
 import numpy as np
-import pandas as pd
-from matplotlib import pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-
-import BZplot as Bp
-import plottool as pt
-
-pt.mpl_init()
-
-def read_gapdat(file_gapdat, enelim, gap_cutoff):
-    df=pd.read_table(file_gapdat, header=None, skiprows=1, \
-                     delim_whitespace = True, \
-                     names=["kx", "ky", "kz", "gap", "Ev", "Ec", "k1", \
-                            "k2", "k3"], dtype='f8'
-    )
-
-    df=df[ df['gap'] <= gap_cutoff ]
-    df=df[ df['Ev'] >= enelim[0] ]
-    df=df[ df['Ev'] <= enelim[1] ]
-
-    k=[ df["{}".format(kn)].to_list() for kn in ["kx", "ky", "kz"] ]
-    Ene=df["Ev"].to_list()
-    return k, Ene
-
-def convertinBZ(k: np.ndarray, kcell):
-    #$BM?$($i$l$?(Bk$BE@$H$=$l$N5U3J;R%Y%/%H%k$@$1J?9T0\F0$7$?(Bk$BE@$N%N%k%`$rHf3S$7!"(B
-    #$B$b$78e<T$NJ}$,>.$5$1$l$P(Bk$BE@:BI8$rCV$-49$($k!#(B
-    #$B$3$l$K$h$jM?$($i$l$?(Bk$BE@$r(BBZ$BFb$NEy2A$J(Bk$BE@$KJQ49$9$k!#(B
-    newk = k.copy()
-    for i in range(len(k[0])):
-        kp = k[:, i].copy()
-        kabs = np.linalg.norm(kp)
-        for lv in kcell :
-            for sgn in [-1, 1] :
-                newkp = kp + sgn * lv
-                if kabs > np.linalg.norm(newkp) :
-                    for j in range(3): newk[j][i] = newkp[j]
-                    kabs = np.linalg.norm(newkp)
+
+#pandas, matplotlib, BZplot, plottool$B$O;H$&4X?t$NCf$G(Bimport$B$9$k(B
+from wtplot.kpindex import dedup_kpoints, lod_reduce, DedupIndex, LODGrid
+import wtplot.render as render
+import wtplot.profiling as profiling
+import wtplot.watch as watch
+
+def filter_gap(a, enelim, gap_cutoff):
+    #a: (5, n)$B$N(Bkx, ky, kz, gap, Ev$B$N$&$A(B, $B>r7o$rK~$?$9E@$N(B(4, m)$B$N(Bkx, ky, kz, Ev$B$rJV$9(B
+    a=a[:, (a[3] <= gap_cutoff) & (a[4] >= enelim[0]) & (a[4] <= enelim[1])]
+    return a[[0, 1, 2, 4]]
+
+def read_gapdat(file_gapdat, enelim, gap_cutoff, chunk_rows=1<<20, dtype='f8'):
+    #chunk_rows$B9T$:$DFI$_(B, gap_cutoff, Enelim$B$N>r7o$rK~$?$5$J$$9T$O$=$N>l$G<N$F$k!#(B
+    #k: (3, n), Ene: (n,)$B$N(Barray$B$rJV$9!#(Bdtype='f4'$B$K$9$k$H(Bfloat32$B$GJV$9(B
+    import pandas as pd
+    reader=pd.read_csv(file_gapdat, header=None, skiprows=1, sep=r'\s+', \
+                       usecols=[0, 1, 2, 3, 4], names=["kx", "ky", "kz", "gap", "Ev"], \
+                       dtype=dtype, engine='c', chunksize=chunk_rows)
+    chunks=[]
+    for df in reader:
+        profiling.add(rows=len(df))
+        chunks.append(filter_gap(df.to_numpy().T, enelim, gap_cutoff))
+    if len(chunks) == 0: return np.empty((3, 0), dtype=dtype), np.empty(0, dtype=dtype)
+    a=np.concatenate(chunks, axis=1)
+    return a[:3], a[3]
+
+@profiling.profiled('read', points=lambda r, *a, **k: len(r[1]))
+def read_gapdats(files_gapdat, enelim, gap_cutoff, workers=None, dtype='f8'):
+    #$BJ#?t$N(Bgap_dat$B$r(Bthread$B$GJBNs$KFI$_(B, 1$B$D$NO"B3$7$?(Barray$B$K$^$H$a$k!#(B
+    #k: (3, n), Ene: (n,)$B$N(Barray$B$rJV$9!#E@$N=gHV$O(Bfile$B$N=gHVDL$j(B
+    if workers is None: workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(files_gapdat)))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        parts = list(ex.map(lambda f: read_gapdat(f, enelim, gap_cutoff, dtype=dtype), files_gapdat))
+
+    n = sum(len(E) for k, E in parts)
+    K = np.empty((3, n), dtype=dtype)
+    Ene = np.empty(n, dtype=dtype)
+    pos = 0
+    for k, E in parts:
+        K[:, pos:pos+len(E)] = k
+        Ene[pos:pos+len(E)] = E
+        pos = pos + len(E)
+    return K, Ene
+
+def reduce_basis(kcell, maxiter=100):
+    #$B5U3J;R%Y%/%H%k$r(B, 2$BK\$:$D(B b_i -= round(b_i$B!&(Bb_j/|b_j|^2) b_j $B$GC;$/$9$kA`:n$r(B
+    #$BJQ2=$,$J$/$J$k$^$G7+$jJV$7(B, $BC;$/D>8r$K6a$$AH$K$9$k!#D%$k3J;R$OJQ$o$i$J$$!#(B
+    b = np.array(kcell, dtype=float)
+    for it in range(maxiter):
+        changed = False
+        for i in range(3):
+            for j in range(3):
+                if i == j: continue
+                m = np.round(b[i]@b[j] / (b[j]@b[j]))
+                if m != 0:
+                    b[i] = b[i] - m * b[j]
+                    changed = True
+        if not changed: break
+    return b
+
+@profiling.profiled('convertinBZ', points=lambda r, k, *a, **kw: np.shape(k)[1])
+def convertinBZ(k: np.ndarray, kcell, chunk_size=2**16):
+    #$BM?$($i$l$?(Bk$BE@$r(BBZ$BFb$NEy2A$J(Bk$BE@$KJQ49$9$k!#(B
+    #k$BE@$r4JLs$7$?5U3J;R$NJ,N(:BI8$G4]$a$F86E@IU6a$N(Bcell$B$KLa$7(B,
+    #$B$=$3$+$i5U3J;R%Y%/%H%k(B(0, $B!^(B1$B$NAH$_9g$o$;(B27$BDL$j(B)$B$@$1J?9T0\F0$7$?Cf$G(B
+    #$B%N%k%`$,:G>.$N$b$N(B(Wigner-Seitz cell$BFb$NE@(B)$B$rA*$V!#(B
+    #k: (3, N)$B$N(Barray, chunk_size$BE@$:$D$^$H$a$F7W;;$7$F%a%b%j;HMQNL$rM^$($k!#(B
+    k = np.asarray(k)
+    b = reduce_basis(kcell)
+    binv = np.linalg.inv(b)
+    n = np.array(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1])).reshape([3, -1]).T
+    shift = (n @ b).astype(k.dtype)
+    b, binv = b.astype(k.dtype), binv.astype(k.dtype)
+
+    newk = np.empty_like(k)
+    for i in range(0, k.shape[1], chunk_size):
+        kc = k[:, i:i+chunk_size].T
+        kc = kc - np.round(kc @ binv) @ b
+        cand = kc[:, None, :] - shift[None, :, :]
+        j = np.argmin(np.einsum('nsd,nsd->ns', cand, cand), axis=1)
+        newk[:, i:i+chunk_size] = cand[np.arange(len(kc)), j].T
     return newk
 
-def copyKpoints(K: np.ndarray, kcell: np.ndarray, shift_num, E=[]):
-    #$BM?$($i$l$?(Bk$BE@$r5U3J;RJ,$@$1$:$i$7$FJ#@=$9$k(B
-    #$BJ#@=$9$kHO0O$O(Bmeshgrid$B$G7h$^$k(B.
-    #shiftnum: k$BE@$r5U3J;R!^(Bn$B8DJ,$@$1$:$i$9(B
+def lattice_shifts(kcell, shift_num):
+    #$B5U3J;R$r3FJ}8~$K(B-shift_num..shift_num$B8D$:$i$9JB?J%Y%/%H%k$N(Blist, shape$B$O(B((2n+1)^3, 3)
     x = np.arange(-1*shift_num, shift_num+1, 1)
     y = np.arange(-1*shift_num, shift_num+1, 1)
     z = np.arange(-1*shift_num, shift_num+1, 1)
 
     m = np.array(np.meshgrid(x, y, z))
     m = m.reshape([3,-1]).T
+    return np.matmul(m, kcell)
+
+@profiling.profiled('copyKpoints', points=lambda r, *a, **k: r[0].shape[1])
+def copyKpoints(K: np.ndarray, kcell: np.ndarray, shift_num, E=None):
+    #$BM?$($i$l$?(Bk$BE@$r5U3J;RJ,$@$1$:$i$7$FJ#@=$9$k(B
+    #$BJ#@=$9$kHO0O$O(Bmeshgrid$B$G7h$^$k(B.
+    #shiftnum: k$BE@$r5U3J;R!^(Bn$B8DJ,$@$1$:$i$9(B
+    K = np.asarray(K)
+    shifts = lattice_shifts(kcell, shift_num).astype(K.dtype)
+    N = K.shape[1]
+    newK = np.empty((3, len(shifts)*N), dtype=K.dtype)
+    for i, s in enumerate(shifts):
+        newK[:, i*N:(i+1)*N] = K - s[:, None]
+    if E is not None and len(E) == N: newE = np.tile(E, len(shifts))
+    else: newE = None
+    return newK, newE
+
+@profiling.profiled('Klimit', points=lambda r, *a, **k: len(r[1]))
+def Klimit(K, E, kcell, xlim, ylim, zlim, shift_num=2):
+    #$BM?$($i$l$?(Bk$BE@$H$=$l$N5U3J;R%Y%/%H%k$@$1J?9T0\F0$7$?Ey2A$J(Bk$BE@$N$&$A(B,
+    #x, y, z$B$NHO0OFb$K$"$k$b$N$@$1$rJV$9!#(B
+    #k$BE@A4BN$r0O$`H"$,HO0O$H=E$J$i$J$$J?9T0\F0$O:G=i$+$i=|$-(B,
+    #$BHO0OFb$K;D$kE@$N?t$r?t$($F$+$i3NJ]$7$?(Barray$B$K5M$a$k!#(B
+    K = np.asarray(K)
+    E = np.asarray(E)
+    lo = np.array([ xlim[0], ylim[0], zlim[0] ], dtype=float)
+    hi = np.array([ xlim[1], ylim[1], zlim[1] ], dtype=float)
+    shifts = lattice_shifts(kcell, shift_num)
+    kmin, kmax = K.min(axis=1), K.max(axis=1)
+    shifts = shifts[ np.all((kmax - shifts >= lo) & (kmin - shifts <= hi), axis=1) ]
 
-    K = K.T
-    for i, x in enumerate(m):
-        if i == 0: newK = K - np.matmul(x, kcell)
-        newK = np.append(newK, K - np.matmul(x, kcell)).reshape([-1, 3])
-        if len(E) == len(K):
-            if i == 0: newE = E.copy()
-            newE = np.append(newE, E)
-        if i == 1: print(newK)
-    return newK.T, newE
-
-def Klimit(K, E, kcell, xlim, ylim, zlim):
-    #$BM?$($i$l$?(Bk$BE@$H$=$l$N5U3J;R%Y%/%H%k$@$1J?9T0\F0$7$?Ey2A$J(Bk$BE@$r(Blist$B$KF~$l!"(B
-    #$B$=$N(Blist$BFb$G(B
-    K, E = copyKpoints(K, kcell, 2, E=E)
-    newK, newE = [], []
-    for kp, ene in zip(K.T, E):
-        if ( xlim[0] <= kp[0] <= xlim[1] ) and \
-           ( ylim[0] <= kp[1] <= ylim[1] ) and \
-           ( zlim[0] <= kp[2] <= zlim[1] ) :
-            newK.append(kp)
-            newE.append(ene)
-    return np.array(newK).T, np.array(newE)
+    #$BJ?9T0\F0$7$?E@(B K-s $B$,HO0OFb(B <=> K $B$,(B lo+s..hi+s $B$NHO0OFb(B
+    masks = []
+    for s in shifts:
+        if np.all((kmin >= lo + s) & (kmax <= hi + s)):
+            #k$BE@A4BN$r0O$`H"$,HO0O$K<}$^$kJ?9T0\F0$OAv::$;$:$KA4E@$r;H$&(B
+            masks.append(slice(None))
+            continue
+        mask = np.ones(K.shape[1], dtype=bool)
+        for j in range(3):
+            mask &= (K[j] >= lo[j] + s[j]) & (K[j] <= hi[j] + s[j])
+        masks.append(np.flatnonzero(mask))
+    counts = [ K.shape[1] if isinstance(mask, slice) else len(mask) for mask in masks ]
 
+    newK = np.empty((3, sum(counts)), dtype=K.dtype)
+    newE = np.empty(sum(counts), dtype=E.dtype)
+    pos = 0
+    for s, mask, c in zip(shifts, masks, counts):
+        newK[:, pos:pos+c] = K[:, mask] - s[:, None].astype(K.dtype)
+        newE[pos:pos+c] = E[mask]
+        pos = pos + c
+    return newK, newE
+
+@profiling.profiled('plot', artists=lambda r, ax, *a, **k: len(ax.get_children()))
 def plot_gapdat(ax, fig, k, Ene, markerSize):
-    cm = plt.cm.get_cmap('RdYlBu')
+    render.ensure_mpl_init()
+    import matplotlib as mpl
+    cm = mpl.colormaps['RdYlBu']
     mappable=ax.scatter(k[0], k[1], k[2], c=Ene, cmap=cm, s=markerSize)
     fig.colorbar(mappable, ax=ax)
 
-def main():
-    args = docopt(__doc__)
+def kpoint_limits(args, K):
+    #-x, -y, -z$B$N$I$l$+$,;XDj$5$l$F$$$l$P(B(xlim, ylim, zlim)$B$rJV$9!#;XDj$7$J$$J}8~$O(BK$B$NHO0O(B
+    if args['-x'] is None and args['-y'] is None and args['-z'] is None: return None
+    lims = []
+    for i, opt in enumerate([ '-x', '-y', '-z' ]):
+        if args[opt] is not None: lims.append(np.array(args[opt].split(','), dtype='f8'))
+        else: lims.append([ K[i].min(), K[i].max() ])
+    return lims
+
+def place_kpoints(args, K, Ene, kcell, lims):
+    #--bz$B$J$i(BBZ$BFb$K0\$7(B, $BHO0O$,;XDj$5$l$F$$$l$PHO0OFb$rKd$a?T$/$9$h$&$KJ#@=$9$k(B
+    if args['--bz'] == True: return convertinBZ(K, kcell), Ene
+    if lims is None: return K, Ene
+    return Klimit(K, Ene, kcell, *lims, shift_num=int(args['-s']))
+
+def watch_gapdat(args, enelim, gap_cutoff, markersize):
+    #gap_dat$B$4$H$K=q$-B-$5$l$?9T$@$1$rFI$_(B, $B>r7o$G9J$C$F(BBZ$BFb$X$N0\F0$dJ#@=$r$7$F$+$iDI2C$9$k!#(B
+    #dedup$B$H(BLOD$B$bDI2C$7$?E@$@$1$KBP$7$F9T$$(B(DedupIndex, LODGrid), $B:#$^$G$NE@A4BN$O$d$jD>$5$J$$(B
+    from matplotlib import pyplot as plt
+    import BZplot as Bp
+    import plottool as pt
+    dtype = 'f4' if args['--compact'] else 'f8'
+    readers = [ watch.TailReader(f, skiprows=1, usecols=[0, 1, 2, 3, 4], dtype=dtype) for f in args['<gap_dat>'] ]
+    buf = watch.ColumnBuffer(dtype)
+    buf.append(np.empty((4, 0)))  #kx, ky, kz, Ene$B$N(B4$BNs(B
+    dedup = DedupIndex(float(args['-d'])) if args['-d'] is not None else None
+    lod = LODGrid(int(args['-b'])) if args['-b'] is not None else None
+
+    fig = plt.figure(figsize=(pt.cminch(32),pt.cminch(20)))
+    ax = fig.add_axes([ 0.05, 0.1, 1, 0.9], projection='3d')
+    bz = Bp.BZ_input(args['<wt_in>'])
+    Bp.BZ_plot(ax, bz.kcell)
+    lims = []
+
+    def poll():
+        grown = False
+        for reader in readers:
+            new, reset = reader.poll()
+            if reset:
+                #$B$I$l$+$N(Bfile$B$,:n$jD>$5$l$?$i(B, $B:#$^$G$NE@$r<N$F$F$9$Y$F$N(Bfile$B$r:G=i$+$iFI$_D>$9(B
+                for r in readers:
+                    if r is not reader: r.reset()
+                buf.clear()
+                lims.clear()
+                if dedup is not None: dedup.clear()
+                if lod is not None: lod.clear()
+                grown = True
+            if new is None: continue
+            a = filter_gap(new, enelim, gap_cutoff)
+            if a.shape[1] == 0: continue
+            if len(lims) == 0: lims.append(kpoint_limits(args, a[:3]))
+            K, Ene = place_kpoints(args, a[:3], a[3], bz.kcell, lims[0])
+            if dedup is not None: K, Ene = dedup.add(K, Ene)
+            if lod is not None: lod.add(K, Ene)
+            else: buf.append(np.vstack([ K, Ene[None, :] ]))
+            grown = True
+        return grown
+
+    poll()
+    plot_gapdat(ax, fig, np.empty((3, 0), dtype=dtype), np.empty(0, dtype=dtype), markersize)
+    sc = ax.collections[-1]
+    ax.set_box_aspect((1,1,1))
+
+    def refresh():
+        #LOD$B$J$iBeI=E@$O(Bbudget$BDxEY$N?t$N(Bvoxel$B$NOB$+$i5a$a$k(B
+        if lod is not None: K, Ene = lod.points(dtype)
+        else: K, Ene = buf.data[:3], buf.data[3]
+        sc.set_offsets(np.column_stack([ K[0], K[1] ]))
+        sc.set_3d_properties(K[2], 'z')
+        sc.set_array(Ene)
+        if len(Ene) > 0: sc.autoscale()
+
+    watch.watch(fig, poll, refresh, interval=float(args['--interval']), \
+                idle=float(args['--idle']) if args['--idle'] is not None else None, \
+                out=args['-o'], dpi=args['--dpi'])
+
+def main(argv=None):
+    args = docopt(__doc__, argv=argv)
+    if args['-b'] is not None and int(args['-b']) < 1: raise DocoptExit("-b <budget> must be at least 1")
+    profiling.setup(args['--profile'], args['--profile-out'])
+    if args['-o'] is not None: render.headless()
+    from matplotlib import pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D
+    import BZplot as Bp
+    import plottool as pt
+    render.ensure_mpl_init()
 
     markersize = float(args['-m'])
     enelim = [ float(e) for e in args['-e'].split(',')]
     gap_cutoff = float(args['-c'])
+    if args['--watch']: return watch_gapdat(args, enelim, gap_cutoff, markersize)
 
-    K, Ene = [[], [], []], []
-    for gap_dat in args['<gap_dat>']:
-        kn, En = read_gapdat(gap_dat, enelim, gap_cutoff)
-        for i in range(3): K[i] = K[i] + kn[i]
-        Ene = Ene + En
+    workers = int(args['-j']) if args['-j'] is not None else None
+    dtype = 'f4' if args['--compact'] else 'f8'
+    K, Ene = read_gapdats(args['<gap_dat>'], enelim, gap_cutoff, workers=workers, dtype=dtype)
 
     #----- BZ$B$N(Bplot -----#
     fig = plt.figure(figsize=(pt.cminch(32),pt.cminch(20)))
@@ -118,25 +291,23 @@ def main():
     Bp.BZ_plot(ax, bz.kcell)
 
     #----- $BI=<(HO0O$K9g$o$;$F(Bk$BE@$rJ#@=(B -----#
-    if args['--bz'] == True :
-        K = convertinBZ(np.array(K), bz.kcell)
-    else :
-        if args['-x'] is not None or args['-y'] is not None \
-        or args['-z'] is not None:
-            if args['-x'] is not None:
-                xlim = np.array(args['-x'].split(','), dtype='f8')
-            else: xlim = [ min(K[0]), max(K[0]) ]
-            if args['-y'] is not None:
-                ylim = np.array(args['-y'].split(','), dtype='f8')
-            else: ylim = [ min(K[1]), max(K[1]) ]
-            if args['-z'] is not None:
-                zlim = np.array(args['-z'].split(','), dtype='f8')
-            else: zlim = [ min(K[2]), max(K[2]) ]
-            K, Ene = Klimit(np.array(K), np.array(Ene), bz.kcell, xlim, ylim, zlim)
+    K, Ene = place_kpoints(args, K, Ene, bz.kcell, kpoint_limits(args, K))
+
+    #----- $B=E$J$C$?(Bk$BE@$r$^$H$a$k(B -----#
+    if args['-d'] is not None:
+        n = len(Ene)
+        K, Ene = dedup_kpoints(K, Ene, float(args['-d']))
+        print("dedup: {} -> {} points".format(n, len(Ene)))
+
+    #----- $BE@$N?t$r(Bbudget$B0J2<$K8:$i$9(B -----#
+    if args['-b'] is not None:
+        n = len(Ene)
+        K, Ene = lod_reduce(K, Ene, int(args['-b']))
+        print("LOD: {} -> {} points".format(n, len(Ene)))
 
     plot_gapdat(ax, fig, K, Ene, markersize)
     ax.set_box_aspect((1,1,1))
-    plt.show()
+    render.show(fig, args['-o'], args['--dpi'])
 
 if __name__=='__main__': main()
 
@@ -0,0 +1,95 @@
+
+"""
+Usage:
+    batch.py <manifest> [-j <jobs>] [--profile]
+
+Options:
+    <manifest>          1行に1つ, 実行するcommandを書いたfile
+    -j <jobs>           並列に描画するprocess数(指定しないとcpu数)
+    --profile           figureごとに処理ごとの時間, memory, 点の数を表示する
+
+manifestの例:
+    # '#'以降と空行は無視する. pathはmanifestのあるdirectoryからの相対path
+    ahc  ahc.dat z -o ahc_z.png --dpi 200
+    curv curv.dat 2d z -s 3 -o curv_2d.pdf
+    bdgap wt.in gap1.dat gap2.dat --bz -b 200000 -o gap.png
+
+各行はwindowを開かずに描画するので, -o <out>が必要。
+同じprocessで何枚も描画するので, 起動やfontの読み込みは最初の1回だけで済む。
+"""
+
+import os
+import sys
+import shlex
+import importlib
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from docopt import docopt
+
+import wtplot.render as render
+import wtplot.profiling as profiling
+
+progs = {
+    'ahc'    : 'wtplot.ahcplot',
+    'anc'    : 'wtplot.ancplot',
+    'curv'   : 'wtplot.curvplot',
+    'bdgap'  : 'wtplot.bandgapplot',
+    'bdplane': 'wtplot.bd_plane_plot',
+}
+
+def read_manifest(file_manifest):
+    #(行番号, argv)のlistを返す
+    jobs = []
+    with open(file_manifest, 'r') as f:
+        for i, line in enumerate(f, 1):
+            argv = shlex.split(line, comments=True)
+            if len(argv) == 0: continue
+            if argv[0] not in progs:
+                raise ValueError("{}:{}: unknown command '{}'".format(file_manifest, i, argv[0]))
+            if '-o' not in argv:
+                raise ValueError("{}:{}: -o <out> is required in batch mode".format(file_manifest, i))
+            jobs.append((i, argv))
+    return jobs
+
+def init_worker(workdir):
+    render.headless()
+    os.chdir(workdir)
+
+def run_job(argv, profile=False):
+    #失敗したときはerrorの文字列を返す
+    from matplotlib import pyplot as plt
+    if profile: profiling.setup(True)
+    try:
+        importlib.import_module(progs[argv[0]]).main(argv[1:])
+        return None
+    except SystemExit as e:
+        return "invalid arguments: {}".format(e)
+    except Exception:
+        return traceback.format_exc()
+    finally:
+        plt.close('all')
+        if profile:
+            print("profile: {}".format(shlex.join(argv)), file=sys.stderr)
+            profiling.report()
+
+def run_batch(file_manifest, workers=None, profile=False):
+    #manifestのcommandを並列に実行し, 失敗した(行番号, error)のlistを返す
+    jobs = read_manifest(file_manifest)
+    workdir = os.path.dirname(os.path.abspath(file_manifest))
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(workdir,)) as ex:
+        for (i, argv), err in zip(jobs, ex.map(run_job, [ argv for i, argv in jobs ], [ profile ] * len(jobs))):
+            if err is None: print("done: {}".format(shlex.join(argv)))
+            else:
+                print("failed: {} (line {})\n{}".format(shlex.join(argv), i, err))
+                failed.append((i, err))
+    print("{} / {} figures rendered".format(len(jobs) - len(failed), len(jobs)))
+    return failed
+
+def main(argv=None):
+    args = docopt(__doc__, argv=argv)
+    workers = int(args['-j']) if args['-j'] is not None else None
+    failed = run_batch(args['<manifest>'], workers=workers, profile=args['--profile'])
+    if len(failed) > 0: raise SystemExit(1)
+
+if __name__ == '__main__': main()
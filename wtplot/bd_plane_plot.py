@@ -1,52 +1,59 @@
 """
 Usage:
-    bd_plane_plot.py <file_dat> [-n <row>]
+    bd_plane_plot.py <file_dat> [-n <row>] [-l <lod>] [--compact] [-o <out>] [--dpi <dpi>] [--profile] [--profile-out <file>]
 
 Options:
     <file_dat>       datfile
-    -n <row>         表示するband番号
+    -n <row>         表示するband番号(指定しないとすべてのband)
+    -l <lod>         surfaceの各方向の点数の上限, 超える分は間引いて表示 [default: 50]
+    --compact        k点とデータをfloat32で読み込み, memoryを約半分にする
+    -o <out>         figureを保存するfile(png, pdf, svgなど), 指定するとwindowを開かない
+    --dpi <dpi>      保存するfigureの解像度
+    --profile        処理ごとの時間, memory, 点の数を表示する
+    --profile-out <file>  処理ごとの記録をjson(.json)かcProfile(.prof)の形式で保存する
 """
 
 from docopt import docopt
 import numpy as np
 
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-
-import plottool as pt
-pt.mpl_init()
+#matplotlibとplottoolはmainの中でimportする
+import wtplot.datio as datio
+import wtplot.render as render
+import wtplot.profiling as profiling
 NumOcEne_row = 6
 
 
-def read_bulkek_plane_dat(file_bp_dat):
-    with open(file_bp_dat, 'r') as fbd:
-        lines = [ l.split() for l in fbd.readlines()[1:] ] 
-
+@profiling.profiled('read', points=lambda r, *a, **k: len(r[0]), bands=lambda r, *a, **k: len(r[1]))
+def read_bulkek_plane_dat(file_bp_dat, dtype='f8'):
     #空白行までの行数を数えることでmeshを調べる
-    for i, line in enumerate(lines):
-        if len(line) < 1: 
-            mesh = [ len(lines[:i]) ]
-            break
-    lines = np.array([ l for l in lines if len(l) > 1 ])
+    mesh = [ datio.first_block_len(file_bp_dat, skiprows=1) ]
+    data = datio.load_text(file_bp_dat, skiprows=1, dtype=dtype)
 
     #直交するmeshは全体のline数から割ることで求める
-    mesh.append( int(len(lines)/mesh[0]) )
+    mesh.append( int(data.shape[1]/mesh[0]) )
 
-    kp = [ [ float(x) for x in line[:3] ] for line in lines ]
-    Ene = [ [ float(x) for x in lines[:, i] ] for i in range(6,10) ]
-    return np.array(kp), np.array(Ene), mesh
+    #NumOcEne_row列目以降がすべてのbandのEnergy, (nband, mesh[0], mesh[1])にする
+    kp = data[:3].T
+    Ene = data[NumOcEne_row:].reshape(-1, mesh[0], mesh[1])
+    return kp, Ene, mesh
 
 def kp_trans(kp):
-    return np.array([ [ k[0], k[1] ] for k in kp ])
+    return np.asarray(kp)[:, :2]
 
-def sfplot(ax, kp, Ene, mesh, Emax=0.3, Emin=-0.3):
+def plane_grid(kp, mesh):
     #ここでのkpは2成分のみ。
-    #datの3次元のkpから平面の座標に変換し、そのkpをここに入れる
-
-    x0=np.reshape(kp[:, 0], (mesh[0], mesh[1]))
-    y0=np.reshape(kp[:, 1], (mesh[0], mesh[1]))
-    E0=np.reshape(Ene, (mesh[0], mesh[1]))
-
+    #(mesh[0], mesh[1])のx, yと, 表示範囲の端を除いた行, 列のmaskを返す。maskはすべてのbandで共通
+    x0 = np.reshape(kp[:, 0], (mesh[0], mesh[1]))
+    y0 = np.reshape(kp[:, 1], (mesh[0], mesh[1]))
+    rows = (x0[:, 0] > x0.min()) & (x0[:, 0] < x0.max())
+    cols = (y0[0] > y0.min()) & (y0[0] < y0.max())
+    return x0, y0, rows, cols
+
+def lod_stride(shape, lod):
+    #各方向の点数がlod程度以下になるように間引く間隔
+    return [ max(1, -(-n // lod)) for n in shape ]
+
+def set_plane_axes(ax, x0, y0, Emax=0.3, Emin=-0.3):
     xmax = x0.max()
     xmin = x0.min()
     ymax = y0.max()
@@ -56,31 +63,44 @@ def sfplot(ax, kp, Ene, mesh, Emax=0.3, Emin=-0.3):
     ax.set_zlim([Emin, Emax])
     ax.set_box_aspect((1, (ymax-ymin)/(xmax-xmin), 1))
 
-    x = x0[(x0[:, 0] > xmin) & (x0[:, 0] < xmax),:]
-    x = x[:,(y0[0] > ymin) & (y0[0] < ymax)]
-    y = y0[(x0[:, 0] > xmin) & (x0[:, 0] < xmax),:]
-    y = y[:,(y0[0] > ymin) & (y0[0] < ymax)]
-    E = E0[(x0[:, 0] > xmin) & (x0[:, 0] < xmax),:]
-    E = E[:,(y0[0] > ymin) & (y0[0] < ymax)]
-    E = np.clip(E, Emin, Emax)
-    ax.plot_surface(x, y, E, alpha=0.4)
-
-def main():
-    args = docopt(__doc__)
+@profiling.profiled('plot', artists=lambda r, ax, *a, **k: len(ax.get_children()))
+def sfplot(ax, x, y, E, stride=(1, 1)):
+    #x, y, Eはplane_gridのmaskで切り出し, Eはclipしたもの
+    render.ensure_mpl_init()
+    ax.plot_surface(x, y, E, alpha=0.4, rstride=stride[0], cstride=stride[1])
+
+def main(argv=None):
+    args = docopt(__doc__, argv=argv)
+    profiling.setup(args['--profile'], args['--profile-out'])
+    if args['-o'] is not None: render.headless()
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D
+    import plottool as pt
+    render.ensure_mpl_init()
     print(args)
-    kp, Ene, mesh= read_bulkek_plane_dat(args['<file_dat>'])
+    dtype = 'f4' if args['--compact'] else 'f8'
+    kp, Ene, mesh= read_bulkek_plane_dat(args['<file_dat>'], dtype=dtype)
     kp = kp_trans(kp)
+    Emax, Emin = 0.3, -0.3
 
     #--- figとaxesの作成 ---#
     fig = plt.figure(figsize=(pt.cminch(20),pt.cminch(18)))
 
     ax = fig.add_axes([ 0.05, 0.05, 0.9, 0.9], projection='3d')
     if args['-n'] is not None: bn = [ int(n) + 1 for n in args['-n'].split(',')]
-    else : bn = range(0, 4)
-    for n in bn:
-        sfplot(ax, kp, Ene[n], mesh)
-
-    plt.show()
+    else : bn = range(0, len(Ene))
+
+    #--- meshとmaskはすべてのbandで共通なので1度だけ作る ---#
+    x0, y0, rows, cols = plane_grid(kp, mesh)
+    set_plane_axes(ax, x0, y0, Emax, Emin)
+    x = x0[rows][:, cols]
+    y = y0[rows][:, cols]
+    E = np.clip(Ene[list(bn)][:, rows][:, :, cols], Emin, Emax)
+    stride = lod_stride(x.shape, int(args['-l']))
+    for En in E:
+        sfplot(ax, x, y, En, stride)
+
+    render.show(fig, args['-o'], args['--dpi'])
 
 if __name__ == '__main__': main()
 
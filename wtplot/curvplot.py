@@ -1,46 +1,82 @@
 
 """
 Usage:
-    curvplot.py <file_curv_dat> <axis> [-r <curv_row>] [-c <clim>] [-n <nmax>]
-    curvplot.py <file_curv_dat> 2d <axis> [-r <curv_row>] [-c <clim>] [-n <nmax>]
-    curvplot.py <file_curv_dat> 3d [-r <curv_row>] [-c <clim>]
+    curvplot.py <file_curv_dat> 2d <axis> [-r <curv_row>] [-c <clim>] [-n <nmax>] [-s <stride>] [--compact] [-o <out>] [--dpi <dpi>] [--profile] [--profile-out <file>]
+    curvplot.py <file_curv_dat> 3d [-r <curv_row>] [-c <clim>] [-s <stride>] [--compact] [--watch] [--interval <sec>] [--idle <sec>] [-o <out>] [--dpi <dpi>] [--profile] [--profile-out <file>]
+    curvplot.py <file_curv_dat> summary [-r <curv_row>] [-s <stride>] [--threshold <t>] [--top <n>] [--chunk <rows>] [--grid <grid_dat>] [--profile] [--profile-out <file>]
+    curvplot.py <file_curv_dat> <axis> [-r <curv_row>] [-c <clim>] [-n <nmax>] [--compact] [--watch] [--interval <sec>] [--idle <sec>] [-o <out>] [--dpi <dpi>] [--profile] [--profile-out <file>]
 
 Options:
     <file_curv_dat> datfile
     <axis>          これを指定すると2Dの等高線を出力, 高さは指定した軸のcurvの値
     2d              これを指定すると2Dのvectorを表示
     3d              これを指定すると3Dのvectorを表示
+    summary         fileを少しずつ読み, 各成分のflux, normの最大値, hotspot, 間引いたgridを出力する
+                    描画はしないので, file全体をmemoryに載せずに済む
     -r <curv_row>   curv_datのcurvの行数 [default: 6-9]
     -c <clim>       colorbarの範囲
     -n <nmax>       normの最大値
+    -s <stride>     vectorを表示するk点の間隔(meshの両方向), summaryではgridの間隔 [default: 5]
+    --threshold <t> summaryでhotspotとするnormの下限(指定しないとnormの大きい順に--top個)
+    --top <n>       summaryで出力するhotspotの数の上限 [default: 10]
+    --chunk <rows>  summaryで一度に読む行数 [default: 262144]
+    --grid <grid_dat>  summaryで間引いたgridをcurv_datと同じ形式で保存する
+    --compact       k点とデータをfloat32で読み込み, memoryを約半分にする
+    --watch         計算中に書き足されていくcurv_datを表示し続ける(3dと<axis>のみ). 書き足された行だけを読む
+                    <axis>ではmeshが揃うまで等高線を描けないので, k点ごとの四角形で表示する
+    --interval <sec>  --watchで描き直す最短の間隔 [default: 2]
+    --idle <sec>    --watchでこの秒数の間fileが増えなければ終わる(指定しないとwindowを閉じるかCtrl-Cまで)
+    -o <out>        figureを保存するfile(png, pdf, svgなど), 指定するとwindowを開かない
+    --dpi <dpi>     保存するfigureの解像度
+    --profile       処理ごとの時間, memory, 点の数を表示する
+    --profile-out <file>  処理ごとの記録をjson(.json)かcProfile(.prof)の形式で保存する
 """
 
 from docopt import docopt
 import numpy as np
 
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-from matplotlib.colors import Normalize
-from mpl_toolkits.mplot3d import Axes3D
+#matplotlibとplottoolは描画する関数の中でimportする
+import wtplot.datio as datio
+import wtplot.render as render
+import wtplot.profiling as profiling
+import wtplot.watch as watch
 
-import plottool as pt
-pt.mpl_init()
-
-def read_curv_dat(file_curv_dat, curv_row):
-    with open(file_curv_dat, 'r') as fcd:
-        lines = [ l.split() for l in fcd.readlines()[4:] ]
-    lines = np.array([ l for l in lines if len(l) > 1 ])
-
-    kp = np.array([ [ float(x) for x in line[:3] ] for line in lines ])
-    curv = np.array([ [ float(x) for x in line[curv_row[0]:curv_row[1]] ] for line in lines ])
+@profiling.profiled('read', points=lambda r, *a, **k: len(r[0]))
+def read_curv_dat(file_curv_dat, curv_row, dtype='f8'):
+    #dtype='f4'にするとkp, curvをfloat32で返す
+    data = datio.load_text(file_curv_dat, skiprows=4, dtype=dtype)
+    kp = data[:3].T
+    curv = data[curv_row[0]:curv_row[1]].T
     return kp, curv
 
 def kp_trans(kp):
-    return np.array([ [ k[0], k[1] ] for k in kp ])
+    return np.asarray(kp)[:, :2]
 
-def curv_3dvec_plot(ax, fig, kp, curv):
-    #ここでのkpは2成分のみ。
-    #datの3次元のkpから平面の座標に変換し、そのkpをここに入れる
+def mesh_stride(mesh, stride):
+    #meshの両方向にstride毎に間引いたk点の番号
+    idx = np.arange(mesh[0] * mesh[1]).reshape(mesh)
+    return idx[::stride, ::stride].ravel()
+
+def arrow_segments(XYZ, UVW, ratio=0.4, angle=15):
+    #矢印(軸と矢じり2本)の線分を(3N, 2, 3)で返す。矢印iの線分は3i, 3i+1, 3i+2
+    tip = XYZ + UVW
+    L = np.linalg.norm(UVW, axis=1, keepdims=True)
+    u = UVW / np.where(L > 0, L, 1)
+    #矢じりを開く方向はuとz軸に垂直な向き, uがz軸に平行ならx軸方向
+    p = np.cross(u, [0, 0, 1])
+    pn = np.linalg.norm(p, axis=1, keepdims=True)
+    p = np.where(pn > 1e-8, p / np.where(pn > 0, pn, 1), [1, 0, 0])
+    t = np.deg2rad(angle)
+    hl = ratio * L
+    h1 = tip - hl * (np.cos(t) * u + np.sin(t) * p)
+    h2 = tip - hl * (np.cos(t) * u - np.sin(t) * p)
+    segs = np.stack([ np.stack([ XYZ, tip ], axis=1),
+                      np.stack([ tip, h1 ], axis=1),
+                      np.stack([ tip, h2 ], axis=1) ], axis=1)
+    return segs.reshape(-1, 2, 3)
+
+def vec3d_axes(ax, kp, nmax=100):
+    #axの範囲をkp(N, 2以上)に合わせ, 矢印の長さの単位default_ltを返す
     xmax = kp[:, 0].max()
     xmin = kp[:, 0].min()
     ymax = kp[:, 1].max()
@@ -49,42 +85,69 @@ def curv_3dvec_plot(ax, fig, kp, curv):
     ax.set_ylim([ymin, ymax])
     ax.set_zlim([-(xmax-xmin)/2, (xmax-xmin)/2])
     ax.set_box_aspect((1, (ymax-ymin)/(xmax-xmin), 1))
-    cm = mpl.colormaps['viridis_r']
-    cmax = 5
-    cmin = 1
-    nmax = 100
-    default_lt = (xmax-xmin) / (nmax*10)
-    for i, cv in enumerate(curv):
-        if i%5 != 0: continue
-        if int(i/101)%5 != 0: continue
-        norm = np.linalg.norm(cv)
-        if norm > nmax: lt = (nmax / np.linalg.norm(cv)) * default_lt
-        else: lt = default_lt
+    return (xmax-xmin) / (nmax*10)
 
-        if norm > cmax: c=cm(1.0) 
-        elif norm < cmin: c=cm(0.0)
-        else: c = cm( ((norm-cmin)/(cmax-cmin))*0.9 + 0.1 )
+def vec3d_arrows(kp, cv, cm, cmin=1, cmax=5, nmax=100):
+    #k点kp(N, 2以上)とcurv cv(N, 3)の矢印の 根元XYZ(N, 3), 長さの単位を1としたときの線分offs(3N, 2, 3), 色(N, 4)
+    #arrow_segmentsは矢印の長さについて線形なので, 線分は arrow_lines(XYZ, offs, default_lt) で求まる
+    cv = np.asarray(cv)
+    norm = np.linalg.norm(cv, axis=1)
+    lt = np.where(norm > nmax, nmax / np.where(norm > 0, norm, 1), 1.0).astype(cv.dtype)
+    c = cm(np.clip((norm-cmin)/(cmax-cmin), 0, 1)*0.9 + 0.1)
+    c[norm > cmax] = cm(1.0)
+    c[norm < cmin] = cm(0.0)
+    XYZ = np.column_stack([ kp[:, 0], kp[:, 1], np.zeros(len(kp), dtype=kp.dtype) ])
+    return XYZ, arrow_segments(np.zeros_like(XYZ), cv * lt[:, None]), c
 
+def arrow_lines(XYZ, offs, default_lt):
+    #vec3d_arrowsの根元と線分から, 長さの単位がdefault_ltの矢印の線分(3N, 2, 3)を作る
+    return np.repeat(XYZ, 6, axis=0).reshape(-1, 2, 3) + default_lt * offs
 
-        #print(k[0], k[1], 0, curv[i][0], curv[i][1], curv[i][2])
-        ax.quiver(kp[i][0], kp[i][1], 0, cv[0], cv[1], cv[2], lw=1.5, \
-                  arrow_length_ratio = 0.4, length = lt, color = c)
+def vec3d_segments(ax, kp, curv, mesh, stride, cm, cmin=1, cmax=5, nmax=100):
+    #axの範囲をkpに合わせ, meshをstride毎に間引いたk点の矢印の線分と色を返す
+    default_lt = vec3d_axes(ax, kp, nmax)
+    idx = mesh_stride(mesh, stride)
+    XYZ, offs, c = vec3d_arrows(kp[idx], np.asarray(curv)[idx], cm, cmin, cmax, nmax)
+    return arrow_lines(XYZ, offs, default_lt), np.repeat(c, 3, axis=0)
+
+@profiling.profiled('plot', artists=lambda r, ax, *a, **k: len(ax.get_children()))
+def curv_3dvec_plot(ax, fig, kp, curv, mesh=None, stride=5):
+    #ここでのkpは2成分のみ。
+    #datの3次元のkpから平面の座標に変換し、そのkpをここに入れる
+    #mesh: k点のmeshの形, 指定しないとkpの並びから求める
+    render.ensure_mpl_init()
+    import matplotlib as mpl
+    from matplotlib.colors import Normalize
+    from mpl_toolkits.mplot3d.art3d import Line3DCollection
+    cm = mpl.colormaps['viridis_r']
+    cmax = 5
+    cmin = 1
+    if mesh is None: mesh = datio.mesh_from_kpoints(kp)
+    segs, colors = vec3d_segments(ax, kp, curv, mesh, stride, cm, cmin, cmax)
+    lc = Line3DCollection(segs, colors=colors, lw=1.5)
+    ax.add_collection3d(lc)
 
     mappable = mpl.cm.ScalarMappable(Normalize(cmin, cmax), cm)
     pp = fig.colorbar(mappable, ax=ax, orientation="vertical")
+    return lc
     #pp.set_clim(-4,4)
     #pp.set_label(“color bar“, fontname="Arial", fontsize=10)
 
 
-def curv_2dh_plot(ax, fig, kp, curv, clim):
+@profiling.profiled('plot', artists=lambda r, ax, *a, **k: len(ax.get_children()))
+def curv_2dh_plot(ax, fig, kp, curv, clim, mesh=None):
+    render.ensure_mpl_init()
+    import matplotlib as mpl
+    from matplotlib.colors import Normalize
     xmax = kp[:, 0].max()
     xmin = kp[:, 0].min()
     ymax = kp[:, 1].max()
     ymin = kp[:, 1].min()
     ax.set_aspect((ymax-ymin)/(xmax-xmin))
-    kx = kp[:, 0].reshape(101, 101)
-    ky = kp[:, 1].reshape(101, 101)
-    cv = curv.reshape(101, 101)
+    if mesh is None: mesh = datio.mesh_from_kpoints(kp)
+    kx = kp[:, 0].reshape(mesh)
+    ky = kp[:, 1].reshape(mesh)
+    cv = curv.reshape(mesh)
     cm = mpl.colormaps['viridis']
 #    ax.pcolor(kx, ky, cv, vmin=0.5, vmax=3, shading="nearest")
     ax.pcolormesh(kx, ky, cv, vmin=clim[0], vmax=clim[1], \
@@ -92,49 +155,256 @@ def curv_2dh_plot(ax, fig, kp, curv, clim):
     mappable = mpl.cm.ScalarMappable(Normalize(clim[0], clim[1]), cm)
     pp = fig.colorbar(mappable, ax=ax, orientation="vertical")
 
-def main():
-    args = docopt(__doc__)
+@profiling.profiled('summary', points=lambda r, *a, **k: r['npoints'])
+def curv_summary(file_curv_dat, curv_row=(6, 9), stride=None, threshold=None, ntop=10, chunk_rows=1<<18):
+    #curv_datをchunk_rows行ずつ読み, 1回の走査で次の量を求めてdictで返す。
+    #memoryはchunk_rows行とhotspot, 間引いたgridの分しか使わない。
+    #  mesh: (外側の点数, 内側の点数), npoints: k点の数
+    #  sum: 成分ごとのcurvの和, dA: 1つのk点が受け持つ面積, flux: sum*dA (meshが1列ならNone)
+    #  max_norm, max_k: normの最大値とそのk点
+    #  hot_k, hot_curv, hot_norm: normがthresholdを超える点のうちnormの大きい順にntop個
+    #  grid: meshの両方向にstride毎に間引いた行(全列), strideがNoneならNone, header: fileの先頭4行
+    #内側の点数が分かるまで(最初の1列を読み終えるまで)の行はgridのために取っておき, 分かってから間引く
+    import pandas as pd
+    r0, r1 = curv_row
+    with open(file_curv_dat, 'r') as f:
+        header = [ f.readline() for i in range(4) ]
+    reader = pd.read_csv(file_curv_dat, header=None, skiprows=4, sep=r'\s+', \
+                         dtype='f8', engine='c', chunksize=chunk_rows)
+
+    total = None
+    start = 0
+    n_inner = None
+    k_first, d0, k_prev, k_jump = None, None, None, None
+    max_norm, max_k = -np.inf, None
+    hot_k, hot_curv, hot_norm = np.empty((0, 3)), np.empty((0, r1-r0)), np.empty(0)
+    grid = [] if stride is not None else None
+    pending = []
+    for df in reader:
+        a = df.to_numpy()
+        kp, cv = a[:, :3], a[:, r0:r1]
+        g = start + np.arange(len(a))
+
+        #内側の点数: k点の間隔が最初の間隔から変わる所までの点数
+        if n_inner is None:
+            if k_first is None: k_first = kp[0]
+            kk = kp if k_prev is None else np.concatenate([ k_prev[None], kp ])
+            d = np.diff(kk, axis=0)
+            if d0 is None and len(d) > 0: d0 = d[0]
+            if d0 is not None and len(d) > 0:
+                tol = 1e-3 * max(np.abs(d0).max(), 1e-12)
+                jump = np.flatnonzero(np.abs(d - d0).max(axis=1) > tol)
+                if len(jump) > 0:
+                    n_inner = start + jump[0] + (1 if k_prev is None else 0)
+                    k_jump = kp[n_inner - start]
+            k_prev = kp[-1]
+        if stride is not None:
+            pending.append((g, a))
+            if n_inner is not None:
+                for gp, ap in pending:
+                    grid.append(ap[(gp // n_inner % stride == 0) & (gp % n_inner % stride == 0)])
+                pending = []
+
+        total = cv.sum(axis=0) if total is None else total + cv.sum(axis=0)
+        norm = np.linalg.norm(cv, axis=1)
+        i = np.argmax(norm)
+        if norm[i] > max_norm: max_norm, max_k = norm[i], kp[i].copy()
+
+        #hotspotはこれまでの候補と合わせてnormの大きい順にntop個だけ残す
+        h = norm > threshold if threshold is not None else np.ones(len(norm), dtype=bool)
+        hot_k = np.concatenate([ hot_k, kp[h] ])
+        hot_curv = np.concatenate([ hot_curv, cv[h] ])
+        hot_norm = np.concatenate([ hot_norm, norm[h] ])
+        if len(hot_norm) > ntop:
+            top = np.argpartition(-hot_norm, ntop)[:ntop]
+            hot_k, hot_curv, hot_norm = hot_k[top], hot_curv[top], hot_norm[top]
+        start += len(a)
+
+    #最後まで内側の点数が分からなければmeshは1列
+    for gp, ap in pending: grid.append(ap[gp % stride == 0])
+    order = np.argsort(-hot_norm)
+    N = start
+    if n_inner is None: n_inner = N
+    mesh = (int(N // n_inner), int(n_inner))
+    dA, flux = None, None
+    if mesh[0] > 1 and d0 is not None:
+        dA = float(np.linalg.norm(np.cross(d0, k_jump - k_first)))
+        flux = total * dA
+    return { 'mesh': mesh, 'npoints': N, 'sum': total, 'dA': dA, 'flux': flux,
+             'max_norm': max_norm, 'max_k': max_k,
+             'hot_k': hot_k[order], 'hot_curv': hot_curv[order], 'hot_norm': hot_norm[order],
+             'grid': None if grid is None else np.concatenate(grid) if grid else np.empty((0, 0)),
+             'header': header }
+
+def write_curv_dat(file_curv_dat, rows, header):
+    #curv_summaryのgridをcurv_datと同じ形式で書き出す
+    with open(file_curv_dat, 'w') as f:
+        f.writelines(header)
+        np.savetxt(f, rows, fmt='%16.8e')
+
+def print_summary(s):
+    print("mesh: {} x {} ({} points)".format(s['mesh'][0], s['mesh'][1], s['npoints']))
+    print("sum : {}".format(" ".join("{: .8e}".format(v) for v in s['sum'])))
+    if s['flux'] is not None:
+        print("flux: {}  (dA = {:.6e})".format(" ".join("{: .8e}".format(v) for v in s['flux']), s['dA']))
+    print("max norm: {:.8e} at k = {}".format(s['max_norm'], " ".join("{: .6f}".format(v) for v in s['max_k'])))
+    print("hotspots:")
+    for k, c, n in zip(s['hot_k'], s['hot_curv'], s['hot_norm']):
+        print("  k = {}  curv = {}  norm = {:.6e}".format(" ".join("{: .6f}".format(v) for v in k), \
+              " ".join("{: .6e}".format(v) for v in c), n))
+    if s['grid'] is not None: print("grid: {} points".format(len(s['grid'])))
+
+def watch_curv(args, curv_row, dtype='f8'):
+    #書き足された行だけを読み, 3dでは矢印の線分を, <axis>では四角形の位置と色を差し替える
+    #meshの内側の点数は最初の1列が揃った所で決め, 範囲や矢印は新しく揃った列の分だけ計算して追加する
+    import matplotlib as mpl
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import Normalize
+    import plottool as pt
+    reader = watch.TailReader(args['<file_curv_dat>'], skiprows=4, dtype=dtype)
+    buf = watch.ColumnBuffer(dtype)
+    #矢印ごとに 根元(3), 長さの単位を1とした線分(18), 色(4) を並べる
+    arrows = watch.ColumnBuffer(dtype)
+    stride = int(args['-s'])
+    axisrow = {'x':0, 'y':1, 'z':2}
+    n_inner, rows, lim, crange = None, 0, None, None
+
+    def poll():
+        nonlocal n_inner, rows, lim, crange
+        new, reset = reader.poll()
+        if reset:
+            buf.clear()
+            arrows.clear()
+            n_inner, rows, lim, crange = None, 0, None, None
+        if new is None: return reset
+        buf.append(new)
+        if n_inner is None:
+            mesh = datio.mesh_from_kpoints(buf.data[:3].T, partial=True)
+            if mesh is not None: n_inner = mesh[1]
+
+        #3dは揃った列だけ, <axis>は読んだ点すべてを使う
+        if args['3d'] == True:
+            if n_inner is None: return True
+            n, start = len(buf) // n_inner * n_inner, rows * n_inner
+        else: n, start = len(buf), rows
+        if n == start: return True
+        block = buf.data[:, start:n]
+        kp = block[:2].T
+        bl = np.concatenate([ kp.min(axis=0), kp.max(axis=0) ])
+        lim = bl if lim is None else np.concatenate([ np.minimum(lim[:2], bl[:2]), np.maximum(lim[2:], bl[2:]) ])
+        if args['3d'] == True:
+            r = np.arange(rows, n // n_inner)
+            idx = ((r[r % stride == 0] - rows)[:, None] * n_inner + np.arange(0, n_inner, stride)[None, :]).ravel()
+            XYZ, offs, c = vec3d_arrows(kp[idx], block[curv_row[0]:curv_row[1], idx].T, cm)
+            arrows.append(np.vstack([ XYZ.T, offs.reshape(len(idx), 18).T, c.T ]))
+            rows = n // n_inner
+        else:
+            cv = block[curv_row[0] + axisrow[args['<axis>']]]
+            cr = np.array([ cv.min(), cv.max() ])
+            crange = cr if crange is None else np.array([ min(crange[0], cr[0]), max(crange[1], cr[1]) ])
+            rows = n
+        return True
+
+    if args['3d'] == True:
+        from mpl_toolkits.mplot3d.art3d import Line3DCollection
+        fig = plt.figure(figsize=(pt.cminch(20), pt.cminch(18)))
+        ax = fig.add_axes([ 0.05, 0.05, 0.9, 0.9 ], projection='3d')
+        cm = mpl.colormaps['viridis_r']
+        #空のcollectionはadd_collection3dで範囲を計算できないので, そのまま追加する(範囲はrefreshで決める)
+        lc = Line3DCollection([], lw=1.5)
+        ax.add_collection(lc)
+        fig.colorbar(mpl.cm.ScalarMappable(Normalize(1, 5), cm), ax=ax, orientation="vertical")
+
+        def refresh():
+            if len(arrows) == 0:
+                lc.set_segments([])
+                return
+            a = arrows.data
+            default_lt = vec3d_axes(ax, lim.reshape(2, 2))
+            lc.set_segments(arrow_lines(a[:3].T, a[3:21].T.reshape(-1, 2, 3), default_lt))
+            lc.set_color(np.repeat(a[21:].T, 3, axis=0))
+
+    else:
+        fig, ax = pt.MakeAxesTable([1], [1], width=18, height=20, margin=2)
+        ax = ax[0][0]
+        sc = ax.scatter(np.empty(0), np.empty(0), c=np.empty(0), cmap=mpl.colormaps['viridis'], \
+                        marker='s', linewidths=0)
+        fig.colorbar(sc, ax=ax, orientation="vertical")
+        clim = [ float(c) for c in args['-c'].split(',') ] if args['-c'] is not None else None
+
+        def refresh():
+            data = buf.data[:, :rows]
+            sc.set_offsets(data[:2].T)
+            sc.set_array(data[curv_row[0] + axisrow[args['<axis>']]])
+            if rows < 2 or lim[2] <= lim[0] or lim[3] <= lim[1]: return
+            xmin, ymin, xmax, ymax = lim
+            ax.set_xlim([xmin, xmax])
+            ax.set_ylim([ymin, ymax])
+            ax.set_aspect((ymax-ymin)/(xmax-xmin))
+            sc.set_clim(*(clim if clim is not None else crange))
+            #四角形の一辺をk点の内側と外側の間隔の大きい方に合わせる(sizeはpointの2乗)
+            step = np.abs(data[:2, 1] - data[:2, 0])
+            if n_inner is not None and rows > n_inner: step = step + np.abs(data[:2, n_inner] - data[:2, 0])
+            ax.apply_aspect()
+            side = max(step[0] * ax.bbox.width / (xmax-xmin), step[1] * ax.bbox.height / (ymax-ymin))
+            sc.set_sizes([ (side * 72 / fig.dpi)**2 ])
+
+    poll()
+    watch.watch(fig, poll, refresh, interval=float(args['--interval']), \
+                idle=float(args['--idle']) if args['--idle'] is not None else None, \
+                out=args['-o'], dpi=args['--dpi'])
+
+def main(argv=None):
+    args = docopt(__doc__, argv=argv)
+    profiling.setup(args['--profile'], args['--profile-out'])
+    if args['summary'] == True:
+        curv_row = [ int(x) for x in args['-r'].split('-') ]
+        threshold = float(args['--threshold']) if args['--threshold'] is not None else None
+        s = curv_summary(args['<file_curv_dat>'], curv_row, stride=int(args['-s']), \
+                         threshold=threshold, ntop=int(args['--top']), chunk_rows=int(args['--chunk']))
+        print_summary(s)
+        if args['--grid'] is not None: write_curv_dat(args['--grid'], s['grid'], s['header'])
+        return
+
+    if args['-o'] is not None: render.headless()
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D
+    import plottool as pt
+    render.ensure_mpl_init()
     print(args)
     curv_row = [ int(x) for x in args['-r'].split('-') ]
 
-    kp, curv = read_curv_dat(args['<file_curv_dat>'], curv_row)
+    dtype = 'f4' if args['--compact'] else 'f8'
+    if args['--watch']: return watch_curv(args, curv_row, dtype)
+    kp, curv = read_curv_dat(args['<file_curv_dat>'], curv_row, dtype=dtype)
 
     if args['3d'] == True:
         #--- figとaxesの作成 ---#
         fig = plt.figure(figsize=(pt.cminch(20), pt.cminch(18)))
         ax = fig.add_axes([ 0.05, 0.05, 0.9, 0.9 ], projection='3d')
 
-        curv_3dvec_plot(ax, fig, kp, curv)
-        plt.show()
+        curv_3dvec_plot(ax, fig, kp, curv, stride=int(args['-s']))
+        render.show(fig, args['-o'], args['--dpi'])
 
     elif args['2d'] == True and args['<axis>'] is not None:
-        ncurv, nkp = [], []
-        for i in range(len(curv)):
-            if i%5 != 0: continue
-            if int(i/101)%5 != 0: continue
-            ncurv.append(curv[i])
-            nkp.append(kp[i])
-        kp = kp_trans(nkp)
+        idx = mesh_stride(datio.mesh_from_kpoints(kp), int(args['-s']))
         axisrow = {'x':[1, 2], 'y':[0, 2], 'z':[0, 1]}
-        cv = np.array([ [ c[r] for r in axisrow[args['<axis>']] ] for c in ncurv ])
-        cvalue = [ np.linalg.norm(v) for v in cv ]
-
+        cv = curv[idx][:, axisrow[args['<axis>']]]
+        kp = kp_trans(kp[idx])
+        cvalue = np.linalg.norm(cv, axis=1)
 
         fig, ax = pt.MakeAxesTable([1], [1], width=18, height=20, margin=2)
 
+        kwargs = {}
         if args['-c'] is not None:
-            climpfx=", clim="
-            clim = [ float(c) for c in args['-c'].split(',')]
-        else: climpfx, clim = "", ""
+            kwargs['clim'] = [ float(c) for c in args['-c'].split(',')]
         if args['-n'] is not None:
-            nmaxpfx=", nmax="
-            nmax = float(args['-n'])
-        else: nmaxpfx, nmax = "", ""
+            kwargs['nmax'] = float(args['-n'])
 
-        cb = eval("pt.vec2dplot(ax[0][0], kp, cv, cvalue=cvalue{}{}{}{})".format(climpfx, clim, nmaxpfx, nmax))
+        cb = pt.vec2dplot(ax[0][0], kp, cv, cvalue=cvalue, **kwargs)
         pp = fig.colorbar(cb, ax=ax[0][0], orientation="vertical")
 
-        plt.show()
+        render.show(fig, args['-o'], args['--dpi'])
 
     elif args['<axis>'] is not None:
         kp = kp_trans(kp)
@@ -146,7 +416,7 @@ def main():
         else: clim = [ cv.min(), cv.max() ]
         curv_2dh_plot(ax[0][0], fig, kp, cv, clim)
 
-        plt.show()
+        render.show(fig, args['-o'], args['--dpi'])
 
 if __name__ == '__main__': main()
 
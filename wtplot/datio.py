@@ -0,0 +1,199 @@
+
+"""
+datfileの読み書き
+
+binary形式:
+    magic(8byte) + headerの長さ(uint64, little endian) + header(json) + 0埋め + data
+    headerには列名"columns", 行数"nrows"などを入れる。
+    dataはfloat64(little endian)を列ごとに並べたもので, 先頭は64byte境界にそろえる。
+    np.memmapで開けるので, 読み込み時にdataのcopyが起きない。
+
+textのdatfileはpandasのC engineでまとめて数値に変換する。
+ancdatなど列名のあるtextでは, 列名の前の"#"で始まる行に key=value を並べてmetaを書ける。
+大きなfileは変換結果を(path, size, mtime)をkeyとしてcache_dirに.npyで保存し,
+次回からはそれをmemmapで開く。cache_dirは環境変数WTPLOT_CACHE_DIRで変えられ, 空にすると使わない。
+同じfileの古い(size, mtimeの違う)変換結果は新しいものを保存するときに消す。
+cache_dir全体がcache_max_size(環境変数WTPLOT_CACHE_MAX, byte)を超えたら, 最後に使ったのが古いものから消す。
+"""
+
+import os
+import json
+import struct
+import hashlib
+import numpy as np
+
+bin_magic = b"WTPLOTB\x01"
+bin_align = 64
+cache_dir = os.environ.get("WTPLOT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "wtplot"))
+cache_min_size = 1 << 20
+cache_max_size = int(os.environ.get("WTPLOT_CACHE_MAX", 4 << 30))
+
+def is_binary(path):
+    with open(path, 'rb') as f:
+        return f.read(len(bin_magic)) == bin_magic
+
+def write_bin(path, names, data, meta=None):
+    #names: 列名のlist, data: 各列のarrayのlist(もしくは(ncol, nrows)のarray)
+    data = [ np.asarray(d, dtype='<f8') for d in data ]
+    nrows = len(data[0]) if len(data) > 0 else 0
+    header = { "columns": list(names), "nrows": nrows, "dtype": "<f8" }
+    if meta is not None: header["meta"] = meta
+    hb = json.dumps(header).encode()
+    offset = len(bin_magic) + 8 + len(hb)
+    pad = -offset % bin_align
+    with open(path, 'wb') as f:
+        f.write(bin_magic)
+        f.write(struct.pack('<Q', len(hb)))
+        f.write(hb)
+        f.write(b"\0" * pad)
+        for d in data:
+            f.write(d.tobytes())
+
+def read_bin_header(path):
+    with open(path, 'rb') as f:
+        if f.read(len(bin_magic)) != bin_magic:
+            raise ValueError("{} is not a wtplot binary file".format(path))
+        hlen = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(hlen))
+    offset = len(bin_magic) + 8 + hlen
+    return header, offset + (-offset % bin_align)
+
+def read_bin(path):
+    #列名のlistと, (ncol, nrows)のmemmapを返す。data[i]がi列目
+    header, offset = read_bin_header(path)
+    shape = (len(header["columns"]), header["nrows"])
+    if shape[0] * shape[1] == 0:
+        return header["columns"], np.empty(shape), header.get("meta")
+    data = np.memmap(path, dtype=header["dtype"], mode='r', offset=offset, shape=shape)
+    return header["columns"], data, header.get("meta")
+
+def cache_prefix(path, skiprows, dtype='f8'):
+    #fileの中身によらない部分(path, skiprows, dtype)のhash。同じfileの古いcacheを探すのに使う
+    key = (os.path.abspath(path), skiprows)
+    if np.dtype(dtype) != np.float64: key = key + (np.dtype(dtype).str,)
+    return hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+
+def cache_path(path, skiprows, dtype='f8'):
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns, skiprows)
+    if np.dtype(dtype) != np.float64: key = key + (np.dtype(dtype).str,)
+    key = repr(key)
+    name = "{}-{}.npy".format(cache_prefix(path, skiprows, dtype), hashlib.sha1(key.encode()).hexdigest()[:20])
+    return os.path.join(cache_dir, name)
+
+def evict_cache(keep):
+    #keepと同じfileの古いcacheを消し, 全体がcache_max_sizeを超えていれば最後に使ったのが古いものから消す
+    prefix = os.path.basename(keep).split('-')[0]
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".npy"): continue
+        p = os.path.join(cache_dir, name)
+        try:
+            if name.startswith(prefix + '-') and p != keep:
+                os.remove(p)
+                continue
+            st = os.stat(p)
+        except OSError: continue
+        entries.append((st.st_mtime, st.st_size, p))
+    total = sum(size for t, size, p in entries)
+    for t, size, p in sorted(entries):
+        if total <= cache_max_size: break
+        if p == keep: continue
+        try: os.remove(p)
+        except OSError: continue
+        total = total - size
+
+def parse_text(path, skiprows=0, dtype='f8'):
+    #空白区切りの数値のtextを読み, (ncol, nrows)のarrayを返す。空行は読み飛ばす
+    #dtype='f4'にするとfloat32で返し, memoryは半分になる
+    import pandas as pd
+    df = pd.read_csv(path, sep=r'\s+', header=None, skiprows=skiprows, \
+                     dtype=dtype, engine='c', skip_blank_lines=True)
+    return np.ascontiguousarray(df.to_numpy().T)
+
+def load_text(path, skiprows=0, dtype='f8'):
+    #parse_textの結果を, 大きなfileではcache_dirに保存しておき再利用する
+    if not cache_dir or os.path.getsize(path) < cache_min_size:
+        return parse_text(path, skiprows, dtype)
+    cp = cache_path(path, skiprows, dtype)
+    if os.path.exists(cp):
+        #使った時刻をmtimeに残し, 消すときの順番に使う
+        try:
+            os.utime(cp)
+            return np.load(cp, mmap_mode='r')
+        except (OSError, ValueError): pass
+    data = parse_text(path, skiprows, dtype)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = "{}.{}.tmp".format(cp, os.getpid())
+        with open(tmp, 'wb') as f: np.save(f, data)
+        os.replace(tmp, cp)
+        evict_cache(cp)
+    except OSError: pass
+    return data
+
+def first_block_len(path, skiprows=0):
+    #最初の空行までのdataの行数。wtのplaneのdatではmeshの1辺の点数になる
+    with open(path, 'r') as f:
+        for i in range(skiprows): f.readline()
+        n = 0
+        for line in f:
+            if not line.strip(): return n
+            n = n + 1
+    return n
+
+def mesh_from_kpoints(kp, partial=False):
+    #平面上に並んだk点(N, 3)から, meshの形(外側の点数, 内側の点数)を求める。
+    #内側の1列の間はk点の間隔が一定なので, 間隔が変わる所までが内側の点数になる
+    #textの桁の丸めで間隔は少しずれるので, 最初の間隔の1e-3倍までのずれは許す
+    #partial=True: 書き込み途中のk点から, 揃っている列だけのmeshを返す。最初の1列が揃うまではNone
+    kp = np.asarray(kp)
+    N = len(kp)
+    if N < 3: return None if partial else (1, N)
+    d = np.diff(kp, axis=0)
+    tol = 1e-3 * max(np.abs(d[0]).max(), 1e-12)
+    jump = np.flatnonzero(np.abs(d - d[0]).max(axis=1) > tol)
+    n = jump[0] + 1 if len(jump) > 0 else N
+    if partial:
+        if len(jump) == 0: return None
+        return (int(N // n), int(n))
+    if N % n != 0:
+        raise ValueError("k-points of {} rows do not form a mesh".format(N))
+    return (int(N // n), int(n))
+
+def as_dtype(data, dtype='f8'):
+    #binary形式のmemmapはfloat64なので, それ以外のdtypeのときだけ変換する
+    if np.dtype(dtype) == data.dtype: return data
+    return np.ascontiguousarray(data, dtype=dtype)
+
+def read_text_header(path):
+    #列名のあるtextの, 先頭の"#"の行に書いたmeta(dict), 列名のlist, 数値の始まる行番号を返す
+    meta = {}
+    with open(path, 'r') as f:
+        line = f.readline()
+        nskip = 1
+        while line.startswith('#'):
+            meta.update(kv.split('=', 1) for kv in line[1:].split() if '=' in kv)
+            line = f.readline()
+            nskip = nskip + 1
+    return meta, line.split(), nskip
+
+def read_table(path, dtype='f8'):
+    #列名の行(その前に"#"のmetaの行があってもよい), 以降が空白区切りの数値のtext(ancdatなど)か,
+    #binary形式のfileを読む。列名のlistと(ncol, nrows)のarrayを返す
+    if is_binary(path):
+        names, data, meta = read_bin(path)
+        return names, as_dtype(data, dtype)
+    meta, names, nskip = read_text_header(path)
+    return names, load_text(path, skiprows=nskip, dtype=dtype)
+
+def read_meta(path):
+    #read_tableで読むfileのmeta(dict)。textではvalueは文字列
+    if is_binary(path): return read_bin_header(path)[0].get("meta") or {}
+    return read_text_header(path)[0]
+
+def text_to_bin(path, out, skiprows=0, names=None):
+    #wtの出力などのtextのdatfileをbinary形式に変換する。列の順番はそのまま
+    data = parse_text(path, skiprows)
+    if names is None: names = [ "col{}".format(i) for i in range(len(data)) ]
+    write_bin(out, names, data)
@@ -0,0 +1,193 @@
+
+"""
+k点の集合(3, N)の間引き
+
+dedup_kpoints: 距離tol以内で重なっているk点を1つにまとめる(cKDTreeで近い組を探す)。
+lod_reduce: 表示用にk点をvoxelごとの代表点にまとめ, 点の数をbudget以下にする。
+DedupIndex, LODGrid: 少しずつ追加されるk点(--watch)に対するdedupとLOD。
+                    1回の追加にかかる時間は追加する点の数にだけ比例し, 今までの点全体をやり直さない。
+"""
+
+import numpy as np
+
+import wtplot.profiling as profiling
+
+def dedup_first(K, tol):
+    #距離tol以内にあるk点どうしをつなぎ, つながった点の組ごとに最初の1点の番号を小さい順に返す。
+    #gridに丸めるのではなく距離で比べるので, mesh点がvoxelの境界に乗っていてもまとめられる
+    from scipy.spatial import cKDTree
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    N = K.shape[1]
+    pairs = cKDTree(K.T, balanced_tree=False).query_pairs(tol, output_type='ndarray')
+    if len(pairs) == 0: return np.arange(N)
+    graph = coo_matrix((np.ones(len(pairs), dtype=bool), (pairs[:, 0], pairs[:, 1])), shape=(N, N))
+    label = connected_components(graph, directed=False)[1]
+    return np.sort(np.unique(label, return_index=True)[1])
+
+@profiling.profiled('dedup', points=lambda r, *a, **k: r[0].shape[1])
+def dedup_kpoints(K, E, tol):
+    #距離tol以内で重なるk点は最初の1点だけを残す
+    K = np.asarray(K)
+    E = np.asarray(E)
+    if K.shape[1] == 0: return K, E
+    first = dedup_first(K, tol)
+    return K[:, first], E[first]
+
+def voxel_key(K, origin, size):
+    #各点の入るvoxelの番号(int64)
+    ijk = np.floor((K - origin[:, None]) / size).astype(np.int64)
+    shape = ijk.max(axis=1) + 1
+    return (ijk[0] * shape[1] + ijk[1]) * shape[2] + ijk[2], int(np.prod(shape))
+
+def count_voxels(K, origin, size):
+    #点の入っているvoxelの数。voxelの総数が小さければsortせずにbincountで数える
+    key, nvox = voxel_key(K, origin, size)
+    if nvox <= max(4 * len(key), 1 << 22):
+        return np.count_nonzero(np.bincount(key, minlength=nvox))
+    key = np.sort(key)
+    return 1 + np.count_nonzero(key[1:] != key[:-1])
+
+@profiling.profiled('lod', points=lambda r, *a, **k: r[0].shape[1])
+def lod_reduce(K, E, budget, steps=8, weights=None):
+    #表示する点の数をbudget以下に減らす。
+    #点の入っているvoxelの数がbudget以下になる一番小さいvoxelの大きさを二分探索で探し,
+    #voxelごとに入っている点の重心とEの平均を代表点とする。
+    #nodal lineやWeyl点のように点が集まっている所はvoxelが残るので形は保たれる。
+    #weights: 各点の重み(点をまとめたものなら点の数). 重心と平均を重み付きでとる
+    if budget < 1: raise ValueError("budget must be at least 1, got {}".format(budget))
+    K = np.asarray(K)
+    E = np.asarray(E)
+    if K.shape[1] <= budget: return K, E
+    origin = K.min(axis=1)
+    extent = max((K.max(axis=1) - origin).max(), 1e-12)
+    #hi: 空間を埋める点でもbudget程度になる大きさ, lo: 線状に並ぶ点でbudget程度になる大きさ
+    hi = extent / max(budget ** (1/3) - 1, 1)
+    lo = max(extent / budget, extent / 2**20)
+    while count_voxels(K, origin, hi) > budget: hi = hi * 2
+    for i in range(steps):
+        mid = np.sqrt(lo * hi)
+        if count_voxels(K, origin, mid) > budget: lo = mid
+        else: hi = mid
+    uniq, inv = np.unique(voxel_key(K, origin, hi)[0], return_inverse=True)
+    w = np.ones(len(E)) if weights is None else weights
+    n = np.bincount(inv, weights=w)
+    newK = np.array([ np.bincount(inv, weights=K[j]*w) / n for j in range(3) ], dtype=K.dtype)
+    newE = (np.bincount(inv, weights=E*w) / n).astype(E.dtype)
+    return newK, newE
+
+def cell_hash(ijk):
+    #整数座標(3, n)のcellの番号(int64)。桁あふれして別のcellと重なってもよい(候補が増えるだけ)
+    return (ijk[0] * 73856093) ^ (ijk[1] * 19349663) ^ (ijk[2] * 83492791)
+
+def voxel_groups(ijk):
+    #整数座標(3, n)を同じvoxelごとにまとめ, (各voxelの最初の点の番号, 各点のvoxelの番号)を返す
+    lo = ijk.min(axis=1)
+    dims = ijk.max(axis=1) - lo + 1
+    if np.prod(dims.astype(float)) < 2.0**62:
+        key = np.ravel_multi_index(ijk - lo[:, None], dims)
+        first, inv = np.unique(key, return_index=True, return_inverse=True)[1:]
+    else:
+        first, inv = np.unique(ijk, axis=1, return_index=True, return_inverse=True)[1:]
+    return first, inv.ravel()
+
+class DedupIndex:
+    #追加されるk点のうち, block内や今までに残した点と距離tol以内で重なるものを除いて残す。
+    #残した点は一辺2tolのcellの番号順に並べた段に持ち, 近くの8個のcellだけを探す。
+    #段の大きさは倍々になるように併合するので段の数はlog程度で,
+    #1回の追加にかかる時間は追加する点の数にだけ比例する(併合は均してlog程度)
+    def __init__(self, tol):
+        self.tol = float(tol)
+        self.runs = []
+        self.offs = np.array(np.meshgrid([0, 1], [0, 1], [0, 1])).reshape(3, -1)
+
+    def clear(self):
+        self.runs = []
+
+    def overlaps(self, K):
+        #Kの各点が今までに残した点と距離tol以内で重なるか
+        m = K.shape[1]
+        dup = np.zeros(m, dtype=bool)
+        if m == 0 or len(self.runs) == 0: return dup
+        #点から±tolの範囲は, 各方向で点の入るcellと点に近い側の隣のcellの中にある
+        x = K / (2 * self.tol)
+        ijk = np.floor(x).astype(np.int64)
+        side = np.where(x - ijk < 0.5, -1, 1)
+        key = cell_hash((ijk[:, None, :] + self.offs[:, :, None] * side[:, None, :]).reshape(3, -1))
+        owner = np.tile(np.arange(m), self.offs.shape[1])
+        order = np.argsort(key)
+        key, owner = key[order], owner[order]
+        for rkey, rK in self.runs:
+            start = np.searchsorted(rkey, key, 'left')
+            n = np.searchsorted(rkey, key, 'right') - start
+            cand = np.repeat(start - np.cumsum(n) + n, n) + np.arange(n.sum())
+            own = np.repeat(owner, n)
+            d2 = ((K[:, own] - rK[:, cand])**2).sum(axis=0)
+            dup[own[d2 <= self.tol**2]] = True
+        return dup
+
+    @profiling.profiled('dedup', points=lambda r, *a, **k: r[0].shape[1])
+    def add(self, K, E):
+        #K: (3, m), E: (m,)を追加し, 残した点(K, E)を返す
+        K = np.asarray(K)
+        E = np.asarray(E)
+        if K.shape[1] == 0: return K, E
+        first = dedup_first(K, self.tol)
+        K, E = K[:, first], E[first]
+        Kf = np.asarray(K, dtype='f8')
+        keep = ~self.overlaps(Kf)
+        K, E, Kf = K[:, keep], E[keep], Kf[:, keep]
+        if K.shape[1] == 0: return K, E
+        key = cell_hash(np.floor(Kf / (2 * self.tol)).astype(np.int64))
+        order = np.argsort(key, kind='stable')
+        self.runs.append((key[order], Kf[:, order]))
+        while len(self.runs) > 1 and len(self.runs[-2][0]) <= 2 * len(self.runs[-1][0]):
+            (k0, K0), (k1, K1) = self.runs[-2], self.runs[-1]
+            key, Kf = np.concatenate([ k0, k1 ]), np.hstack([ K0, K1 ])
+            order = np.argsort(key, kind='stable')
+            self.runs[-2:] = [ (key[order], Kf[:, order]) ]
+        return K, E
+
+class LODGrid:
+    #追加されるk点を細かいvoxelごとに 点の数, kの和, Eの和 としてまとめておく。
+    #点の入っているvoxelがcap(budgetのfine倍)を超えたらvoxelの一辺を倍にする。
+    #原点は固定なので倍のvoxelは元のvoxel 8つをちょうど合わせたものになり,
+    #和を足し合わせれば点から数え直したものと同じになる。
+    #持つのはvoxelごとの和だけなので, 追加や代表点を求める時間は追加する点とbudgetの大きさにだけ比例する
+    def __init__(self, budget, fine=8):
+        if budget < 1: raise ValueError("budget must be at least 1, got {}".format(budget))
+        self.budget = budget
+        self.cap = fine * budget
+        self.clear()
+
+    def clear(self):
+        self.size = None
+        self.ijk = np.empty((3, 0), dtype=np.int64)
+        self.n = np.empty(0)
+        self.sK = np.empty((3, 0))
+        self.sE = np.empty(0)
+
+    def add(self, K, E):
+        K = np.asarray(K, dtype='f8')
+        E = np.asarray(E, dtype='f8')
+        if K.shape[1] == 0: return
+        if self.size is None:
+            #最初は1点ずつ別のvoxelに入る程度に小さくしておく
+            self.size = max(np.abs(K).max(), 1e-12) / 2**20
+        ijk = np.hstack([ self.ijk, np.floor(K / self.size).astype(np.int64) ])
+        #voxelの数がcap以下になるまで一辺を倍にする(>>は負の数でも2で割った切り捨て)
+        shift = 0
+        first, inv = voxel_groups(ijk)
+        while len(first) > self.cap:
+            shift = shift + 1
+            first, inv = voxel_groups(ijk >> shift)
+        self.size = self.size * 2**shift
+        self.ijk = (ijk >> shift)[:, first]
+        self.n = np.bincount(inv, weights=np.concatenate([ self.n, np.ones(len(E)) ]))
+        self.sK = np.array([ np.bincount(inv, weights=np.concatenate([ self.sK[j], K[j] ])) for j in range(3) ])
+        self.sE = np.bincount(inv, weights=np.concatenate([ self.sE, E ]))
+
+    def points(self, dtype='f8'):
+        #代表点の(K, E)。細かいvoxelの重心を点の数の重み付きでlod_reduceにかける
+        K, E = (self.sK / self.n).astype(dtype), (self.sE / self.n).astype(dtype)
+        return lod_reduce(K, E, self.budget, weights=self.n)
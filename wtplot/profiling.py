@@ -0,0 +1,163 @@
+
+"""
+処理ごとの時間, memory, 点の数の記録
+
+各CLIの--profile, もしくは環境変数WTPLOT_PROFILEで有効になる。
+有効なときだけ, profiledをつけた関数の呼び出しごとに
+    経過時間, その時点までのprocessの最大RSS, 扱った点の数
+を記録し, 終了時に処理の名前ごとにまとめた表を表示する。
+処理ごとの最大memoryはtracemallocで測るが, 確保のたびに記録するので時間が何倍にもなる。
+環境変数WTPLOT_PROFILE_MEM=1(もしくはsetupのmem=True)のときだけ測る。
+WTPLOT_PROFILE(もしくは--profile-out)に
+    .jsonで終わるpathを指定すると記録をjsonで保存する
+    .prof, .pstatsで終わるpathを指定するとcProfileの結果を保存する(pstatsやsnakevizで読める)
+無効なときは関数の呼び出しにboolの判定が1回増えるだけで, 何も記録しない。
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import functools
+import tracemalloc
+
+enabled = False
+out = None
+records = []
+stack = []
+lock = threading.Lock()
+profiler = None
+registered = False
+
+def max_rss():
+    #processの最大RSS(byte), 測れないOSではNone
+    try:
+        import resource
+    except ImportError: return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def setup(profile=False, profile_out=None, mem=None):
+    #CLIの--profile, --profile-outに対応する。どちらかが指定されていれば記録を始め, 終了時に表を表示する
+    #mem: tracemallocで処理ごとの最大memoryも測る, 指定しないと環境変数WTPLOT_PROFILE_MEM
+    global enabled, out, profiler, registered
+    if not profile and profile_out is None: return
+    enabled = True
+    if profile_out is not None: out = profile_out
+    if mem is None: mem = os.environ.get("WTPLOT_PROFILE_MEM", "") not in ("", "0")
+    if mem and not tracemalloc.is_tracing(): tracemalloc.start()
+    if out is not None and out.endswith(('.prof', '.pstats')) and profiler is None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if not registered:
+        atexit.register(report)
+        registered = True
+
+class Stage:
+    #with Stage(name): で囲んだ部分を1つの記録にする。入れ子にしてもよい
+    def __init__(self, name, **counts):
+        self.rec = { 'name': name }
+        self.rec.update(counts)
+
+    def __enter__(self):
+        if not enabled: return self
+        with lock:
+            #親の処理の最大memoryを退避してから, この処理の分を測り直す
+            if tracemalloc.is_tracing():
+                if stack: stack[-1]['_peak'] = max(stack[-1].get('_peak', 0), tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+                self.rec['_mem0'] = tracemalloc.get_traced_memory()[0]
+            stack.append(self.rec)
+        self.t0 = time.perf_counter()
+        return self
+
+    def add(self, **counts):
+        for key, v in counts.items():
+            self.rec[key] = self.rec.get(key, 0) + v
+
+    def __exit__(self, *exc):
+        if not enabled: return False
+        t = time.perf_counter() - self.t0
+        with lock:
+            self.rec['time'] = t
+            stack.remove(self.rec)
+            if '_mem0' in self.rec:
+                peak = max(self.rec.pop('_peak', 0), tracemalloc.get_traced_memory()[1])
+                self.rec['peak'] = peak - self.rec.pop('_mem0')
+                if stack: stack[-1]['_peak'] = max(stack[-1].get('_peak', 0), peak)
+            else: self.rec['peak'] = None
+            self.rec['rss'] = max_rss()
+            records.append(self.rec)
+        return False
+
+def add(**counts):
+    #実行中の一番内側の処理に数を足す。threadから呼んでもよい
+    if not enabled: return
+    with lock:
+        if not stack: return
+        for key, v in counts.items():
+            stack[-1][key] = stack[-1].get(key, 0) + v
+
+def profiled(name=None, **counters):
+    #関数の呼び出しを1つの記録にするdecorator。
+    #countersには 数の名前=関数(返り値, 引数...) を与え, 呼び出しの後にその値を記録する
+    def deco(func):
+        label = name or func.__qualname__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled: return func(*args, **kwargs)
+            with Stage(label) as st:
+                res = func(*args, **kwargs)
+                for key, f in counters.items():
+                    try: st.add(**{ key: int(f(res, *args, **kwargs)) })
+                    except Exception: pass
+            return res
+        return wrapper
+    return deco
+
+def summary():
+    #処理の名前ごとに 呼び出し回数, 合計時間, 最大memory, 最大RSS, 数の合計 をまとめる(最初に呼ばれた順)
+    #tracemallocで測っていないときは最大memoryはNone
+    table = {}
+    for r in records:
+        s = table.setdefault(r['name'], { 'calls': 0, 'time': 0.0, 'peak': None, 'rss': None, 'counts': {} })
+        s['calls'] += 1
+        s['time'] += r['time']
+        if r['peak'] is not None: s['peak'] = max(s['peak'] or 0, r['peak'])
+        if r['rss'] is not None: s['rss'] = max(s['rss'] or 0, r['rss'])
+        for key, v in r.items():
+            if key in ('name', 'time', 'peak', 'rss'): continue
+            s['counts'][key] = s['counts'].get(key, 0) + v
+    return table
+
+def report(file=None):
+    #表を表示し, outが指定されていればjsonかcProfileの結果を保存する
+    global profiler
+    if not enabled or not records: return
+    file = file or sys.stderr
+    if profiler is not None: profiler.disable()
+    print("{:<28} {:>6} {:>11} {:>11} {:>11}  {}".format("stage", "calls", "time [ms]", "peak [MiB]", "RSS [MiB]", "counts"), file=file)
+    for name, s in summary().items():
+        rss = "{:11.1f}".format(s['rss'] / 2**20) if s['rss'] is not None else "{:>11}".format("-")
+        peak = "{:11.2f}".format(s['peak'] / 2**20) if s['peak'] is not None else "{:>11}".format("-")
+        counts = " ".join("{}={}".format(k, v) for k, v in s['counts'].items())
+        print("{:<28} {:6d} {:11.2f} {} {}  {}".format(name, s['calls'], s['time'] * 1e3, peak, rss, counts), file=file)
+    if tracemalloc.is_tracing():
+        print("(tracemallocで最大memoryを測っているので, 時間は実際より長い)", file=file)
+    else: print("(処理ごとの最大memoryはWTPLOT_PROFILE_MEM=1で測る. 時間は長くなる)", file=file)
+    if out is not None:
+        if profiler is not None:
+            profiler.dump_stats(out)
+            profiler = None
+        elif out.endswith('.json'):
+            with open(out, 'w') as f:
+                json.dump({ "records": records, "summary": summary() }, f, indent=1)
+        print("profile saved to {}".format(out), file=file)
+    records.clear()
+
+env = os.environ.get("WTPLOT_PROFILE", "")
+if env and env != "0":
+    setup(True, None if env == "1" else env)
@@ -0,0 +1,39 @@
+
+"""
+figureの出力
+
+各CLIは-o <out>を指定するとAgg backendでfileに保存し, windowを開かない。
+保存形式は拡張子(png, pdf, svgなど)で決まる。
+"""
+
+import wtplot.profiling as profiling
+
+mpl_initialized = False
+
+def ensure_mpl_init():
+    #plottoolのrcParamsの設定(mpl_init)を, 最初にfigureを作るか描くときに1度だけ行う
+    global mpl_initialized
+    if mpl_initialized: return
+    import plottool as pt
+    pt.mpl_init()
+    mpl_initialized = True
+
+def headless():
+    #windowを開かないAgg backendに切り替える。pyplotをimportした後でもfigureを作る前ならよい
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+
+def show(fig=None, out=None, dpi=None):
+    #outがなければ今まで通りwindowに表示し, あればfileに保存してfigureを閉じる
+    from matplotlib import pyplot as plt
+    if out is None:
+        plt.show()
+        return
+    if fig is None: fig = plt.gcf()
+    save(fig, out, dpi)
+    plt.close(fig)
+
+def save(fig, out, dpi=None):
+    #figureは閉じずにfileに保存する(--watchで描き直すたびに使う)
+    with profiling.Stage('render', figures=1):
+        fig.savefig(out, dpi=float(dpi) if dpi is not None else 'figure')
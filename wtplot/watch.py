@@ -0,0 +1,143 @@
+
+"""
+書き込み途中のdatfileの監視(--watch)
+
+wtの計算中に少しずつ書き足されるdatfile(ahc, curv, gap)を表示し続ける。
+TailReader: 前回読んだ所のbyte offsetを覚えておき, 書き足された完全な行だけを読む。
+            file全体を読み直さないので, 1回の確認にかかる時間は書き足された量にだけ比例する。
+            fileが作り直されたら(計算のやり直しなど)最初から読み直し, 呼び出し側に知らせる。
+ColumnBuffer: 読んだ行を(ncol, n)のarrayに追加していく。容量は倍々に増やす。
+watch: 新しい行があればartistのdataを差し替え, 前回から--interval秒以上経っていれば描き直す。
+       figureは作り直さない。windowを閉じるかCtrl-C, もしくは--idle秒の間fileが増えなければ終わる。
+"""
+
+import io
+import os
+import time
+import numpy as np
+
+import wtplot.render as render
+import wtplot.profiling as profiling
+
+#fileが作り直されたかを調べるのに比べる, 先頭と前回読んだ所の直前のbyte数
+check_bytes = 4096
+
+class TailReader:
+    #skiprows: fileの先頭のheaderの行数, usecols: 読む列(指定しないと全部)
+    def __init__(self, path, skiprows=0, usecols=None, dtype='f8'):
+        self.path = path
+        self.skiprows = skiprows
+        self.usecols = usecols
+        self.dtype = np.dtype(dtype)
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.skip = self.skiprows
+        self.ino = None
+        self.head = b""
+        self.tail = b""
+
+    def rewritten(self, f, st):
+        #前回から作り直されたか。inodeは使い回されることがあるので,
+        #fileの先頭と, 前回読んだ所の直前(それぞれcheck_bytesまで)が前回と同じかも調べる
+        if self.offset == 0: return False
+        if st.st_size < self.offset or st.st_ino != self.ino: return True
+        f.seek(0)
+        if f.read(len(self.head)) != self.head: return True
+        f.seek(self.offset - len(self.tail))
+        return f.read(len(self.tail)) != self.tail
+
+    @profiling.profiled('poll', points=lambda r, *a, **k: r[0].shape[1])
+    def poll(self):
+        #前回の続きから書き足された完全な行を読み, ((ncol, m)のarrayかNone, reset)を返す。
+        #書きかけの最後の行は次回に読む。
+        #resetがTrueならfileが作り直されたので最初から読んだ。呼び出し側は今までのdataを捨てる
+        import pandas as pd
+        try: st = os.stat(self.path)
+        except FileNotFoundError: return None, False
+        with open(self.path, 'rb') as f:
+            reset = self.rewritten(f, st)
+            if reset: self.reset()
+            self.ino = st.st_ino
+            if st.st_size == self.offset: return None, reset
+            f.seek(self.offset)
+            chunk = f.read(st.st_size - self.offset)
+        end = chunk.rfind(b'\n') + 1
+        if end == 0: return None, reset
+        chunk = chunk[:end]
+        if len(self.head) < check_bytes: self.head = (self.head + chunk)[:check_bytes]
+        self.tail = (self.tail + chunk)[-check_bytes:]
+        self.offset = self.offset + end
+
+        nskip = min(self.skip, chunk.count(b'\n'))
+        self.skip = self.skip - nskip
+        try:
+            df = pd.read_csv(io.BytesIO(chunk), sep=r'\s+', header=None, skiprows=nskip, \
+                             usecols=self.usecols, dtype=self.dtype, engine='c', skip_blank_lines=True)
+        except pd.errors.EmptyDataError: return None, reset
+        if len(df) == 0: return None, reset
+        return np.ascontiguousarray(df.to_numpy().T), reset
+
+class ColumnBuffer:
+    def __init__(self, dtype='f8'):
+        self.dtype = np.dtype(dtype)
+        self.buf = None
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def append(self, a):
+        #a: (ncol, m)のarray
+        a = np.asarray(a, dtype=self.dtype)
+        m = a.shape[1]
+        if self.buf is None:
+            self.buf = np.empty((a.shape[0], max(m, 1024)), dtype=self.dtype)
+        elif self.n + m > self.buf.shape[1]:
+            buf = np.empty((self.buf.shape[0], max(2*self.buf.shape[1], self.n + m)), dtype=self.dtype)
+            buf[:, :self.n] = self.buf[:, :self.n]
+            self.buf = buf
+        self.buf[:, self.n:self.n+m] = a
+        self.n = self.n + m
+
+    def clear(self):
+        self.n = 0
+
+    @property
+    def data(self):
+        #今までに追加した(ncol, n)のarray(コピーしないview)
+        if self.buf is None: return np.empty((0, 0), dtype=self.dtype)
+        return self.buf[:, :self.n]
+
+def watch(fig, poll, refresh, interval=2.0, idle=None, out=None, dpi=None):
+    #poll(): 新しいdataを読み, 増えたらTrueを返す
+    #refresh(): 今までのdataをartistに反映する。描き直す直前にだけ呼ぶ
+    #outがあれば描き直すたびにfileに保存する
+    from matplotlib import pyplot as plt
+    dt = min(0.5, interval)
+    last_draw = -np.inf
+    last_data = time.monotonic()
+    dirty = True
+    if out is None: plt.show(block=False)
+    try:
+        while True:
+            now = time.monotonic()
+            if poll():
+                dirty = True
+                last_data = now
+            if dirty and now - last_draw >= interval:
+                refresh()
+                if out is None: fig.canvas.draw_idle()
+                else: render.save(fig, out, dpi)
+                last_draw = now
+                dirty = False
+            if idle is not None and not dirty and now - last_data >= idle: break
+            if out is None:
+                if not plt.fignum_exists(fig.number): break
+                fig.canvas.start_event_loop(dt)
+            else: time.sleep(dt)
+    except KeyboardInterrupt: pass
+    if dirty:
+        refresh()
+        if out is not None: render.save(fig, out, dpi)